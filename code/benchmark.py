@@ -0,0 +1,432 @@
+"""
+Local benchmarks, no network access needed. API calls go to fake_openai.Fake_OpenAI and every input is
+generated from a fixed seed, so numbers are comparable between commits on the same machine.
+
+Usage:
+    python3 benchmark.py html [epub_path]      compare the HTML to text backends on an epub
+    python3 benchmark.py extract [chapters]    chapter extraction throughput per backend and worker count
+    python3 benchmark.py parse [scripts]       script parsing and validation throughput
+    python3 benchmark.py fanout [latency]      image and speech fan-out throughput against the fake API
+    python3 benchmark.py clients [packages]    per package overhead of building clients vs one Pipeline_Context
+    python3 benchmark.py video [seconds]       compare the moviepy and ffmpeg video backends on a synthetic package
+    python3 benchmark.py all                   run every benchmark above
+
+Add "--json PATH" to also write the results, with the current commit, to PATH.
+"""
+import os
+import sys
+import json
+import time
+import resource
+import tempfile
+import subprocess
+import base64
+import threading
+import random as rd
+import contextlib
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import ebooklib
+from ebooklib import epub
+from prettytable import PrettyTable
+
+import html_text
+from cache import Disk_Cache
+from fake_openai import Fake_OpenAI, synthetic_png, synthetic_mp3, synthetic_script
+from rate_limiter import Request_Scheduler
+from ffmpeg_writer import get_ffmpeg_binary
+
+WORDS = ("the ship drifted through the void while the crew argued about the orbit of a distant "
+         "world and its forges burned with an ancient light").split()
+
+
+def build_sample_epub(path, num_chapters=40, paragraphs_per_chapter=60, seed=0):
+    """
+    Writes a synthetic epub with titled chapters, entities, inline markup and front matter to `path`.
+    """
+    rng = rd.Random(seed)
+    book = epub.EpubBook()
+    book.set_identifier("benchmark-sample")
+    book.set_title("Benchmark Sample")
+    book.set_language("en")
+
+    chapters = []
+    license_page = epub.EpubHtml(title="License", file_name="license.xhtml")
+    license_page.content = "<h1>License</h1><p>All rights reserved &amp; so on.</p>"
+    chapters.append(license_page)
+
+    for i in range(num_chapters):
+        paragraphs = []
+        for _ in range(paragraphs_per_chapter):
+            words = [rng.choice(WORDS) for _ in range(rng.randint(20, 80))]
+            words[rng.randrange(len(words))] = f"<em>{rng.choice(WORDS)}</em>"
+            paragraphs.append(f"<p>{' '.join(words)} &#8212; &quot;end&quot;.</p>")
+        chapter = epub.EpubHtml(title=f"Chapter {i + 1}", file_name=f"chapter_{i + 1}.xhtml")
+        chapter.content = f"<h2>Chapter <span>{i + 1}</span></h2><style>p {{ margin: 0 }}</style>{''.join(paragraphs)}"
+        chapters.append(chapter)
+
+    for chapter in chapters:
+        book.add_item(chapter)
+    book.toc = chapters
+    book.spine = ["nav"] + chapters
+    book.add_item(epub.EpubNcx())
+    book.add_item(epub.EpubNav())
+    epub.write_epub(path, book)
+    return path
+
+
+def read_documents(epub_path):
+    book = epub.read_epub(epub_path)
+    return [item.get_content() for item in book.get_items() if item.get_type() == ebooklib.ITEM_DOCUMENT]
+
+
+def benchmark_html_backends(epub_path=None, repeat=3):
+    """
+    Times every HTML to text backend on the same documents and checks they agree with the reference
+    backend on chapter titles and word counts.
+    """
+    if epub_path is None:
+        epub_path = build_sample_epub(tempfile.mktemp(suffix=".epub"))
+    documents = read_documents(epub_path)
+
+    results = {}
+    timings = {}
+    for name in html_text.TEXT_BACKENDS:
+        backend = html_text.get_text_backend(name)
+        best = float("inf")
+        for _ in range(repeat):
+            start = time.perf_counter()
+            extracted = [backend.extract(document) for document in documents]
+            best = min(best, time.perf_counter() - start)
+        results[name] = [(title, len(text.split())) for title, text in extracted]
+        timings[name] = best
+
+    reference = results["soup"]
+    rows = []
+    table = PrettyTable()
+    table.field_names = ["Backend", "Documents", "Best time (s)", "Speedup", "Matches reference"]
+    for name, timing in timings.items():
+        table.add_row([name, len(documents), round(timing, 4), round(timings["soup"] / timing, 2), results[name] == reference])
+        rows.append({"benchmark": "html", "case": name, "wall": timing, "documents_per_second": len(documents) / timing})
+    print(table)
+
+    for name, result in results.items():
+        for index, (expected, actual) in enumerate(zip(reference, result)):
+            if expected != actual:
+                print(f"{name} differs on document {index}: expected {expected}, got {actual}")
+    return rows
+
+
+def benchmark_extraction(num_chapters=40, worker_counts=(1, None)):
+    """
+    Times Extract_Information end to end (epub reading, text extraction, tokenization) for every
+    HTML backend, in-process and with the default process pool.
+    Without the gpt-4o encoding (offline, no TIKTOKEN_CACHE_DIR) it runs on the byte level encoding instead,
+    and says so, the tokenization share of the times is then not representative.
+    """
+    import information_extraction as ie
+
+    epub_path = build_sample_epub(tempfile.mktemp(suffix=".epub"), num_chapters=num_chapters)
+    tokenizer = "gpt-4o"
+    try:
+        ie.get_encoding("gpt-4o")
+    except Exception as e:
+        print(f"The gpt-4o tokenizer is not available offline ({e}), timing extraction with the byte level encoding")
+        os.environ[ie.TOKENIZER_ENV] = "bytes"
+        ie.get_encoding.cache_clear()
+        tokenizer = "bytes"
+
+    rows = []
+    table = PrettyTable()
+    table.field_names = ["Backend", "Workers", "Tokenizer", "Chapters", "Wall time (s)", "Chapters/s"]
+    for backend in html_text.TEXT_BACKENDS:
+        for workers in worker_counts:
+            start = time.perf_counter()
+            chapters = ie.Extract_Information(epub_path, "gpt-4o", workers=workers, backend=backend).get_chapters()
+            wall = time.perf_counter() - start
+            table.add_row([backend, workers or os.cpu_count(), tokenizer, len(chapters), round(wall, 3), round(len(chapters) / wall, 1)])
+            rows.append({"benchmark": "extract", "case": f"{backend}/{workers or 'auto'}", "wall": wall,
+                         "chapters_per_second": len(chapters) / wall, "tokenizer": tokenizer})
+    print(table)
+    return rows
+
+
+def benchmark_script_parsing(num_scripts=200, repeat=3):
+    """
+    Times parsing and validating fake GPT scripts written to disk, with Script_Processor and with the
+    streaming parser (which also writes the processed JSON).
+    """
+    import script_creation as sc
+
+    script_dir = tempfile.mkdtemp()
+    paths = []
+    for i in range(num_scripts):
+        paths.append(os.path.join(script_dir, f"script_{i}.txt"))
+        with open(paths[-1], "w", encoding="utf-8") as script_file:
+            script_file.write(synthetic_script(i))
+
+    output_dir = tempfile.mkdtemp()
+
+    def parse_whole(path):
+        processor = sc.Script_Processor()
+        script = processor.text_to_dict(path)
+        return len(script["substories"]) if processor.validate_script(script) else 0
+
+    def parse_streaming(path):
+        return sum(1 for _ in sc.write_substories(sc.stream_script(path), os.path.join(output_dir, "script.json")))
+
+    cases = {"text_to_dict+validate": parse_whole, "stream_script+write": parse_streaming}
+
+    rows = []
+    table = PrettyTable()
+    table.field_names = ["Parser", "Scripts", "Valid substories", "Best time (s)", "Scripts/s"]
+    for case, parse in cases.items():
+        best = float("inf")
+        for _ in range(repeat):
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(None):
+                valid = sum(parse(path) for path in paths)
+            best = min(best, time.perf_counter() - start)
+        table.add_row([case, num_scripts, valid, round(best, 4), round(num_scripts / best, 1)])
+        rows.append({"benchmark": "parse", "case": case, "wall": best, "scripts_per_second": num_scripts / best})
+    print(table)
+    return rows
+
+
+def benchmark_fanout(latency=0.2, num_requests=16, concurrency_levels=(1, 2, 4, 8)):
+    """
+    Generates `num_requests` images and speech lines against a fake API with a fixed latency, at several
+    concurrency levels. With no cache hits, throughput should grow with concurrency until the level reaches the request count.
+    """
+    import image_generator as ig
+    import tts
+
+    for seed in range(16):
+        synthetic_png(seed)  # Encode the fake payloads up front, so the first level is not penalized.
+
+    rows = []
+    table = PrettyTable()
+    table.field_names = ["Stage", "Concurrency", "Requests", "Wall time (s)", "Requests/s"]
+    for concurrency in concurrency_levels:
+        output_dir = tempfile.mkdtemp()
+        client = Fake_OpenAI(latency=latency)
+        # Limits high enough to never throttle, this measures the fan-out itself.
+        scheduler = Request_Scheduler(rate_limits={"chat": 1e6, "images": 1e6, "speech": 1e6})
+        prompts = [f"{' '.join(WORDS[i % 7:i % 7 + 10])} number {i}" for i in range(num_requests)]
+
+        image_generator = ig.Image_Generator(client=client, max_in_flight=concurrency,
+                                             cache=Disk_Cache(f"{output_dir}/cache/images", ".png"), scheduler=scheduler)
+        start = time.perf_counter()
+        image_generator.generate_images(f"{output_dir}/images", prompts, "benchmark")
+        image_wall = time.perf_counter() - start
+
+        speech_generator = tts.Speech_Generator(client=client, max_workers=concurrency,
+                                            cache=Disk_Cache(f"{output_dir}/cache/audio", ".mp3"), scheduler=scheduler)
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(None):
+            speech_generator.generate_audio(f"{output_dir}/audio", prompts)
+        speech_wall = time.perf_counter() - start
+
+        for stage, wall in (("images", image_wall), ("speech", speech_wall)):
+            table.add_row([stage, concurrency, num_requests, round(wall, 3), round(num_requests / wall, 1)])
+            rows.append({"benchmark": "fanout", "case": f"{stage}/{concurrency}", "wall": wall, "requests_per_second": num_requests / wall})
+    print(table)
+    return rows
+
+
+class Local_OpenAI_Handler(BaseHTTPRequestHandler):
+    """
+    Answers the image and speech endpoints over HTTP/1.1 with keep-alive, and counts the TCP connections
+    opened by clients, which is what a shared connection pool saves.
+    """
+    protocol_version = "HTTP/1.1"
+    connections = 0
+    lock = threading.Lock()
+
+    def setup(self):
+        super().setup()
+        with Local_OpenAI_Handler.lock:
+            Local_OpenAI_Handler.connections += 1
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.path.endswith("/images/generations"):
+            body = json.dumps({"created": 0, "data": [{"b64_json": base64.b64encode(synthetic_png(0, "64x64")).decode("ascii")}]}).encode()
+            content_type = "application/json"
+        else:
+            body = synthetic_mp3(2.0)
+            content_type = "audio/mpeg"
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def benchmark_client_reuse(num_packages=20, chunks_per_package=5):
+    """
+    Generates the images and audio of `num_packages` packages against a local HTTP server, either building
+    new generators (and with them new OpenAI clients, connection pools and .env reads) for every package,
+    or reusing the generators of one Pipeline_Context.
+    """
+    import image_generator as ig
+    import tts
+    from pipeline_context import Pipeline_Context
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Local_OpenAI_Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{server.server_address[1]}/v1"
+    os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+    scheduler = Request_Scheduler(rate_limits={"chat": 1e6, "images": 1e6, "speech": 1e6})
+    prompts = [f"{' '.join(WORDS[i:i + 8])}" for i in range(chunks_per_package)]
+
+    def run(build_generators):
+        output_dir = tempfile.mkdtemp()
+        Local_OpenAI_Handler.connections = 0
+        setup_time = 0.0
+        start = time.perf_counter()
+        for package in range(num_packages):
+            setup_start = time.perf_counter()
+            image_generator, speech_generator = build_generators()
+            setup_time += time.perf_counter() - setup_start
+            # Fresh caches so every request reaches the server.
+            image_generator.cache = Disk_Cache(f"{output_dir}/cache/images/{package}", ".png")
+            speech_generator.cache = Disk_Cache(f"{output_dir}/cache/audio/{package}", ".mp3")
+            image_generator.generate_images(f"{output_dir}/{package}/images", prompts, "benchmark")
+            with contextlib.redirect_stdout(None):
+                speech_generator.generate_audio(f"{output_dir}/{package}/audio", prompts)
+        return time.perf_counter() - start, setup_time, Local_OpenAI_Handler.connections
+
+    def per_package():
+        return ig.Image_Generator(scheduler=scheduler), tts.Speech_Generator(scheduler=scheduler)
+
+    context = Pipeline_Context(scheduler=scheduler)
+    try:
+        results = {"per package": run(per_package),
+                   "shared context": run(lambda: (context.image_generator, context.speech_generator))}
+    finally:
+        context.close()
+        server.shutdown()
+
+    rows = []
+    table = PrettyTable()
+    table.field_names = ["Clients", "Packages", "Wall time (s)", "Setup per package (ms)", "Connections opened"]
+    for case, (wall, setup_time, connections) in results.items():
+        table.add_row([case, num_packages, round(wall, 3), round(setup_time / num_packages * 1000, 2), connections])
+        rows.append({"benchmark": "clients", "case": case, "wall": wall,
+                     "setup_ms_per_package": setup_time / num_packages * 1000, "connections": connections})
+    print(table)
+    return rows
+
+
+def build_synthetic_package(path, num_chunks=5, seconds_per_chunk=6.0, seed=0):
+    """
+    Writes image_{i}.png (alternating wide and narrow, so both pan and still segments are covered)
+    and silent audio_{i}.mp3 files into a package folder at `path`.
+    """
+    from PIL import Image
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    os.makedirs(f"{path}/images", exist_ok=True)
+    os.makedirs(f"{path}/audio", exist_ok=True)
+    for i in range(num_chunks):
+        size = (1024, 1024) if i % 2 == 0 else (512, 1024)
+        # Smooth gradients with light noise, closer to generated artwork than pure noise.
+        gradient = np.linspace(0, 200, size[0], dtype=np.float32)[None, :, None] + np.linspace(0, 55, size[1], dtype=np.float32)[:, None, None]
+        noise = rng.normal(0, 4, size=(size[1], size[0], 3))
+        pixels = np.clip(gradient * rng.uniform(0.5, 1.0, size=3) + noise, 0, 255).astype(np.uint8)
+        Image.fromarray(pixels).save(f"{path}/images/image_{i}.png")
+        subprocess.run([get_ffmpeg_binary(), "-y", "-loglevel", "error", "-f", "lavfi", "-i", "anullsrc=r=24000:cl=mono",
+                        "-t", str(seconds_per_chunk), "-b:a", "64k", f"{path}/audio/audio_{i}.mp3"], check=True)
+    return path
+
+
+def render_package(backend, path):
+    """
+    Renders one package with the given backend and prints wall time and peak RSS as JSON.
+    Runs in its own process so every backend starts from a clean peak RSS.
+    """
+    import video_assembler as va
+
+    story = {"lines": [" ".join(WORDS[:12])] * len(os.listdir(f"{path}/images"))}
+    start = time.perf_counter()
+    va.Video_Editor(backend=backend).generate_video(path, story)
+    wall = time.perf_counter() - start
+    print(json.dumps({
+        "wall": wall,
+        "python_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "encoder_rss_mb": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024,
+    }))
+
+
+def benchmark_video_backends(seconds_per_chunk=6.0, backends=("moviepy", "ffmpeg")):
+    path = build_synthetic_package(tempfile.mkdtemp(), seconds_per_chunk=seconds_per_chunk)
+
+    rows = []
+    table = PrettyTable()
+    table.field_names = ["Backend", "Video length (s)", "Wall time (s)", "Peak Python RSS (MB)", "Peak encoder RSS (MB)"]
+    for backend in backends:
+        result = subprocess.run([sys.executable, os.path.abspath(__file__), "render", backend, path],
+                                check=True, capture_output=True, text=True)
+        stats = json.loads(result.stdout.strip().splitlines()[-1])
+        table.add_row([backend, seconds_per_chunk * 5, round(stats["wall"], 2),
+                       round(stats["python_rss_mb"], 1), round(stats["encoder_rss_mb"], 1)])
+        rows.append({"benchmark": "video", "case": backend, **stats})
+    print(table)
+    return rows
+
+
+def write_results(rows, path):
+    """ Writes the results with the commit they were measured on, so runs of two commits can be diffed. """
+    commit = subprocess.run(["git", "-C", os.path.dirname(os.path.abspath(__file__)), "rev-parse", "--short", "HEAD"],
+                            capture_output=True, text=True).stdout.strip()
+    with open(path, "w", encoding="utf-8") as results_file:
+        json.dump({"commit": commit or None, "cpu_count": os.cpu_count(), "results": rows}, results_file, indent=4)
+    print(f"Results written to {path}")
+
+
+def main():
+    args = sys.argv[1:]
+    json_path = None
+    if "--json" in args:
+        json_index = args.index("--json")
+        json_path = args[json_index + 1]
+        args = args[:json_index] + args[json_index + 2:]
+    if not args:
+        print(__doc__)
+        return
+
+    value = args[1] if len(args) > 1 else None
+    if args[0] == "html":
+        rows = benchmark_html_backends(value)
+    elif args[0] == "extract":
+        rows = benchmark_extraction(int(value) if value else 40)
+    elif args[0] == "parse":
+        rows = benchmark_script_parsing(int(value) if value else 200)
+    elif args[0] == "fanout":
+        rows = benchmark_fanout(float(value) if value else 0.2)
+    elif args[0] == "clients":
+        rows = benchmark_client_reuse(int(value) if value else 20)
+    elif args[0] == "video":
+        rows = benchmark_video_backends(float(value) if value else 6.0)
+    elif args[0] == "all":
+        rows = (benchmark_html_backends() + benchmark_extraction() + benchmark_script_parsing()
+                + benchmark_fanout() + benchmark_client_reuse() + benchmark_video_backends())
+    elif args[0] == "render":
+        render_package(args[1], args[2])
+        return
+    else:
+        print(f"Unknown benchmark '{args[0]}'")
+        print(__doc__)
+        return
+
+    if json_path is not None:
+        write_results(rows, json_path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import tempfile
+import threading
+from pathlib import Path
+
+# Puts between two full scans of a bounded cache, these pick up expired entries and entries written by other processes.
+SCAN_INTERVAL = 256
+# A full cache is evicted down to this share of max_bytes, so the next scan is only due after that much new data.
+EVICT_TO = 0.9
+
+def replace_file(destination, data):
+    """
+    Writes `data` to a new file that is then moved over `destination`. The old file may be a hard link to a
+    cache entry (see Disk_Cache.link_into), writing into it in place would change the cached entry as well.
+    """
+    destination = Path(destination)
+    destination.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=destination.parent, suffix=".tmp")
+    with os.fdopen(fd, "wb") as tmp_file:
+        tmp_file.write(data)
+    os.replace(tmp_path, destination)
+    return destination
+
+
+class Disk_Cache():
+    """
+    Content addressed on-disk cache. Entries are stored under the sha256 of their key parts,
+    and are evicted oldest first once the cache grows past `max_bytes` or an entry is older than `max_age` seconds.
+    """
+
+    def __init__(self, directory, suffix="", max_bytes=None, max_age=None):
+        self.directory = Path(directory)
+        self.suffix = suffix
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.directory.mkdir(parents=True, exist_ok=True)
+        # Kept up to date by put_bytes, so the directory is only scanned when the cache is full or every SCAN_INTERVAL puts.
+        self.total_bytes = 0
+        self.puts_since_scan = 0
+        self.evict()
+
+    @staticmethod
+    def make_key(*parts):
+        key_source = json.dumps(parts, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(key_source.encode("utf-8")).hexdigest()
+
+    def path_for(self, key):
+        return self.directory / key[:2] / f"{key}{self.suffix}"
+
+    def get(self, key):
+        """
+        Returns the path of the cached entry, or None on a miss or when the entry has expired.
+        A hit refreshes the entry's timestamp so eviction removes the least recently used entries first.
+        """
+        path = self.path_for(key)
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            self.record(hit=False)
+            return None
+
+        if self.max_age is not None and time.time() - stat.st_mtime > self.max_age:
+            path.unlink(missing_ok=True)
+            with self.lock:
+                self.total_bytes -= stat.st_size
+            self.record(hit=False)
+            return None
+
+        os.utime(path)
+        self.record(hit=True)
+        return path
+
+    def record(self, hit):
+        with self.lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def stats(self):
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses}
+
+    def link_into(self, key, destination):
+        """
+        Hard-links the cached entry to `destination`, falling back to a copy across filesystems.
+        Returns True on a hit, False on a miss. The destination shares the entry's inode, so it must only be
+        replaced (see replace_file), never opened for writing.
+        """
+        path = self.get(key)
+        if path is None:
+            return False
+
+        destination = Path(destination)
+        destination.parent.mkdir(parents=True, exist_ok=True)
+        destination.unlink(missing_ok=True)
+        try:
+            os.link(path, destination)
+        except OSError:
+            shutil.copyfile(path, destination)
+        return True
+
+    def put_bytes(self, key, data):
+        path = self.path_for(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            replaced_size = path.stat().st_size
+        except FileNotFoundError:
+            replaced_size = 0
+
+        # Write to a temporary file first so readers never see a partial entry.
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        with os.fdopen(fd, "wb") as tmp_file:
+            tmp_file.write(data)
+        os.replace(tmp_path, path)
+
+        if self.max_bytes is None and self.max_age is None:
+            return path
+        with self.lock:
+            self.total_bytes += len(data) - replaced_size
+            self.puts_since_scan += 1
+            full = self.max_bytes is not None and self.total_bytes > self.max_bytes
+            due = full or self.puts_since_scan >= SCAN_INTERVAL
+        if due:
+            self.evict()
+        return path
+
+    def put_file(self, key, source):
+        with open(source, "rb") as source_file:
+            return self.put_bytes(key, source_file.read())
+
+    def evict(self):
+        """
+        Scans the cache, removes expired entries, then the oldest entries until it fits in EVICT_TO of `max_bytes`.
+        Resets the running total to what is left.
+        """
+        if self.max_bytes is None and self.max_age is None:
+            return
+
+        with self.lock:
+            entries = []
+            for path in self.directory.glob(f"*/*{self.suffix}"):
+                try:
+                    stat = path.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+
+            now = time.time()
+            if self.max_age is not None:
+                for entry in [e for e in entries if now - e[0] > self.max_age]:
+                    entry[2].unlink(missing_ok=True)
+                    entries.remove(entry)
+
+            total = sum(size for _, size, _ in entries)
+            if self.max_bytes is not None and total > self.max_bytes:
+                entries.sort()
+                for _, size, path in entries:
+                    if total <= self.max_bytes * EVICT_TO:
+                        break
+                    path.unlink(missing_ok=True)
+                    total -= size
+            self.total_bytes = total
+            self.puts_since_scan = 0
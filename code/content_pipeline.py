@@ -1,137 +1,383 @@
 import sys
 import os
 import shutil
-from uuid import uuid4
 from pathlib import Path
 import json
+import time
+import contextlib
+import socket
+import threading
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
 
 import information_extraction as ie
 import script_creation as sc
 import image_generator as ig
 import tts as tts
 import video_assembler as va
+from package_index import Package_Index
+from package_manifest import Package_Manifest, MANIFEST_FILE, hash_content, make_package_id
+from job_queue import Job_Queue
+from pipeline_context import Pipeline_Context
+from script_index import Script_Index
+from text_chunker import pack_parts, utilization_report, MAX_CHAPTERS_PER_REQUEST
+from tracing import tracer, load_trace, summarize, export_chrome_trace
 
 # ---------------------------------------------------------------------------
 # 1. Extraction Step
 # ---------------------------------------------------------------------------
-def extract_chapters(epub_path: str, model_name: str = "gpt-4o", display_info: bool = True):
+def extract_chapters(epub_path: str, model_name: str = "gpt-4o", display_info: bool = True, stream: bool = False, workers=None, backend="soup"):
     """
     Extract all chapters from the given EPUB and return them.
+    With stream=True a generator is returned instead, yielding chapters while the rest of the book is still being parsed.
     """
-    extraction = ie.Extract_Information(epub_path, model_name)
-    
+    if stream:
+        extraction = ie.Extract_Information(epub_path, model_name, lazy=True, workers=workers, backend=backend)
+        return traced_chapters(extraction.iter_chapters(), backend)
+
+    with tracer.span("extract_chapters", backend=backend) as span:
+        extraction = ie.Extract_Information(epub_path, model_name, workers=workers, backend=backend)
+        span.set("chapters", len(extraction.get_chapters()))
+
     if display_info:
         extraction.get_chapter_info(displayInfo=True)
     
     return extraction.get_chapters()
 
+def traced_chapters(chapters, backend):
+    """ Passes the streamed chapters through and records the extraction span once the book is exhausted. """
+    start = time.time()
+    count = 0
+    for chapter in chapters:
+        count += 1
+        yield chapter
+    tracer.record("extract_chapters", start, time.time() - start, backend=backend, chapters=count, stream=True)
+
 # ---------------------------------------------------------------------------
 # 2. Script Creation
 # ---------------------------------------------------------------------------
-def create_scripts(chapters, script_generator=None):
+def create_scripts(chapters, script_generator=None, max_workers=4, chapters_per_request=MAX_CHAPTERS_PER_REQUEST):
     """
     Given a list of chapters, create a script file for each.
+    Long chapters are cut into token chunks, and adjacent short chapters are packed into one request of up to
+    `chapters_per_request` chapters (structured output only, text scripts are requested one part at a time). Every request is sent to GPT concurrently, with at most `max_workers`
+    requests in flight, and chunk i of a chapter is always written to {cleaned_title}_{i}.txt,
+    or straight to processed_scripts/{cleaned_title}_{i}.json for structured output.
     """
     if script_generator is None:
         script_generator = sc.Script_Generator()
-    
-    for chapter in chapters:
-        script_generator.create_script(chapter)
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as script_pool:
+        jobs = []
+        # Only structured substories carry their chapter number, text scripts cannot be split back per chapter.
+        if script_generator.output_format != "json":
+            chapters_per_request = 1
+        for parts in pack_parts(script_generator.plan_parts(chapters), max_chapters=max(1, chapters_per_request)):
+            future = script_pool.submit(tracer.wrap(script_generator.generate_scripts_for_parts), parts, num_scripts=3)
+            jobs.append((parts, future))
+        utilization_report([parts for parts, _ in jobs])
+
+        for parts, future in jobs:
+            for part, script in zip(parts, future.result()):
+                script_generator.write_script(script, part.script_title)
 
 # ---------------------------------------------------------------------------
 # 3. Process Scripts into JSON
 # ---------------------------------------------------------------------------
-def process_scripts(input_dir="data_output/scripts"):
+def process_scripts(input_dir="data_output/scripts", output_dir="data_output/processed_scripts", index=None):
     """
-    Reads each raw script from `input_dir` and processes it into a standardized JSON structure.
-    Returns a list of tuples: [(processed_json_path, original_script_path), ...].
+    Yields (script_name, substory) for every substory that may still need work. New raw scripts in `input_dir`
+    are parsed in a single pass, and each substory is yielded as soon as it is validated, while the JSON file
+    in `output_dir` is written. Scripts processed on earlier runs follow. The Script_Index skips unchanged
+    scripts whose videos are all done, without reading them.
     """
-    script_processor = sc.Script_Processor()
-    processed = []
-    for script_file in os.listdir(input_dir):
+    index = index or Script_Index()
+    new_scripts = set()
+    for script_file in sorted(os.listdir(input_dir)):
         raw_path = os.path.join(input_dir, script_file)
-        json_path = script_processor.process_script(raw_path)
-        processed.append((json_path, raw_path))
+        json_path = os.path.join(output_dir, Path(script_file).stem + ".json")
+        script_name = os.path.basename(json_path)
+
+        package_ids = []
+        for story in sc.write_substories(sc.stream_script(raw_path), json_path):
+            package_ids.append(make_package_id(script_name, story))
+            yield script_name, story
+
+        if not package_ids:
+            print(f"Script validation failed for {raw_path}. Discarding.")
+            continue
+        # move file to used_scripts folder
+        os.rename(raw_path, os.path.join(os.path.dirname(input_dir.rstrip("/")), "used_scripts", script_file))
+        index.record(json_path, package_ids)
+        new_scripts.add(json_path)
 
-    processed.extend(script_processor.get_all_processed_scripts())
-    return processed
+    for processed_file in sorted(os.listdir(output_dir)):
+        json_path = os.path.join(output_dir, processed_file)
+        if not processed_file.endswith(".json") or json_path in new_scripts or index.is_done(json_path):
+            continue
+        with open(json_path, "r", encoding="utf-8") as json_file:
+            substories = json.load(json_file).get("substories", [])
+        stories = [story for idx, story in enumerate(substories) if sc.validate_substory(story, idx)]
+        index.record(json_path, [make_package_id(processed_file, story) for story in stories])
+        for story in stories:
+            yield processed_file, story
 
 # ---------------------------------------------------------------------------
 # 4. Generate Images
 # ---------------------------------------------------------------------------
-def generate_images_for_stories(package_path: str, story):
-    image_generator = ig.Image_Generator()
-    images_dir = os.path.join(package_path, "images")
-    Path(images_dir).mkdir(parents=True, exist_ok=True)
+def generate_images_for_stories(package_path: str, story, max_in_flight: int = 4, manifest=None, image_generator=None):
+    """
+    Pass the run's shared `image_generator` (see Pipeline_Context), one is only built here as a fallback.
+    """
     prompts = story["prompts"]
     general_prompt = story["general_prompt"]
-    image_generator.generate_images(images_dir, prompts, general_prompt)
+
+    # Skip the stage if its inputs are unchanged and every image is still intact.
+    manifest = manifest or Package_Manifest(package_path)
+    input_hash = hash_content(prompts, general_prompt)
+    if manifest.is_complete("images", input_hash):
+        print(f"Images already complete in {package_path}")
+        return
+
+    with tracer.span("images", package=os.path.basename(package_path)):
+        image_generator = image_generator or ig.Image_Generator(max_in_flight=max_in_flight)
+        images_dir = os.path.join(package_path, "images")
+        Path(images_dir).mkdir(parents=True, exist_ok=True)
+        image_generator.generate_images(images_dir, prompts, general_prompt, max_in_flight)
+    manifest.record("images", input_hash, [f"images/image_{i}.png" for i in range(len(prompts))])
 
 # ---------------------------------------------------------------------------
 # 5. Generate TTS Audio
 # ---------------------------------------------------------------------------
-def generate_audio_for_stories(package_path: str, story):
-    tts_generator = tts.Speech_Generator()
-    audio_dir = os.path.join(package_path, "audio")
-    Path(audio_dir).mkdir(parents=True, exist_ok=True)
+def generate_audio_for_stories(package_path: str, story, max_workers: int = 4, manifest=None, speech_generator=None):
+    """
+    Pass the run's shared `speech_generator` (see Pipeline_Context), one is only built here as a fallback.
+    """
     lines = story["lines"]
-    tts_generator.generate_audio(audio_dir, lines)
+
+    manifest = manifest or Package_Manifest(package_path)
+    input_hash = hash_content(lines)
+    if manifest.is_complete("audio", input_hash):
+        print(f"Audio already complete in {package_path}")
+        return
+
+    with tracer.span("audio", package=os.path.basename(package_path)):
+        speech_generator = speech_generator or tts.Speech_Generator(max_workers=max_workers)
+        audio_dir = os.path.join(package_path, "audio")
+        Path(audio_dir).mkdir(parents=True, exist_ok=True)
+        speech_generator.generate_audio(audio_dir, lines, max_workers)
+    manifest.record("audio", input_hash, [f"audio/audio_{i}.mp3" for i in range(len(lines))])
 
 # ---------------------------------------------------------------------------
 # 6. Assemble Video
 # ---------------------------------------------------------------------------
-def assemble_video_from_package(package_path: str, story=None):
+def assemble_video_from_package(package_path: str, story=None, video_backend: str = "moviepy", index=None, video_editor=None):
     """
     Uses the script, images, and audio in the `package_path` folder to assemble a final video.
+    `index` is the package's Package_Index when the caller already built it.
+    Returns True once the package has been moved to ready, False on error.
     """
-    video_assembler = va.Video_Editor()
+    video_assembler = video_editor or va.Video_Editor(backend=video_backend)
+    manifest = Package_Manifest(package_path)
+    input_hash = hash_content(manifest.artifact_hashes("images", "audio"), story)
     try:
-        video_assembler.generate_video(package_path, story)
+        if not manifest.is_complete("video", input_hash):
+            with tracer.span("video", package=os.path.basename(package_path)):
+                video_assembler.generate_video(package_path, story, index=index)
+            manifest.record("video", input_hash, ["video.mp4"])
         os.rename(package_path, package_path.replace("packages", "ready"))
+        return True
     except Exception as e:
         print(f"Error assembling video in {package_path}: {e}")
+        return False
 
 # ---------------------------------------------------------------------------
-# Helper: Process a single script into package folders
+# Helper: Process scripts into package folders
 # ---------------------------------------------------------------------------
-def process_one_script(json_script_path: str, json_script, skip_video=False, subs=True):
+def create_package(original_file_name: str, story):
+    """
+    Creates the package folder and saves only the substory into it,
+    using the original file name. Returns the package folder path.
+    The folder name is derived from the script name and substory content,
+    so a rerun picks up the same folder and its finished stages.
+    """
+    package_id = make_package_id(original_file_name, story)
+    package_dir = f"data_output/packages/{package_id}"
+    Path(package_dir).mkdir(parents=True, exist_ok=True)
+
+    subscript_path = os.path.join(package_dir, original_file_name)
+    with open(subscript_path, "w", encoding="utf-8") as f:
+        json.dump(story, f, indent=4)
+
+    return package_dir
+
+def build_package(package_dir: str, story, image_concurrency: int = 4, tts_workers: int = 4, context=None):
+    """
+    Generates images and TTS audio for one substory at the same time,
+    since neither stage depends on the other.
+    """
+    manifest = Package_Manifest(package_dir)
+    image_generator = context.image_generator if context is not None else None
+    speech_generator = context.speech_generator if context is not None else None
+    with ThreadPoolExecutor(max_workers=2) as stage_pool:
+        images = stage_pool.submit(generate_images_for_stories, package_dir, story, image_concurrency, manifest, image_generator)
+        audio = stage_pool.submit(generate_audio_for_stories, package_dir, story, tts_workers, manifest, speech_generator)
+        images.result()
+        audio.result()
+
+def process_all_scripts(substories, skip_video=False, subs=True, package_workers=2,
+                        image_concurrency=4, tts_workers=4, video_workers=None, video_backend="moviepy", context=None):
+    """
+    Schedules every substory of every processed script as its own package.
+    Up to `package_workers` packages generate images and audio at the same time,
+    and each finished package is handed to a process pool of `video_workers`
+    for rendering, so API bound and CPU bound stages overlap across packages.
+    `substories` is an iterable of (script_name, substory) pairs, e.g. from process_scripts.
+    A package is submitted as soon as its substory comes out of the iterable.
+    Every package shares the generators of `context`, a Pipeline_Context is built for the call if none is given.
+    """
+    packages = iter_packages(substories)
+
+    owned_context = context is None
+    if owned_context:
+        context = Pipeline_Context(image_concurrency=image_concurrency, tts_workers=tts_workers)
+    # Spawned, not forked: the API threads of the context may hold locks (logging, httpx, sqlite) a forked child would inherit locked.
+    video_pool = None if skip_video else ProcessPoolExecutor(max_workers=video_workers, mp_context=multiprocessing.get_context("spawn"))
+    try:
+        video_futures = []
+        with ThreadPoolExecutor(max_workers=max(1, package_workers)) as package_pool:
+            futures = {
+                package_pool.submit(build_package, package_dir, story, image_concurrency, tts_workers, context): (package_dir, story)
+                for package_dir, story in packages
+            }
+            for future in as_completed(futures):
+                package_dir, story = futures[future]
+                try:
+                    future.result()
+                except Exception as e:
+                    print(f"Error generating package {package_dir}: {e}")
+                    continue
+
+                if video_pool is None:
+                    continue
+
+                # Validate the package from file headers before handing it to a render process.
+                index = Package_Index(package_dir)
+                if not index.is_valid():
+                    print(f"Skipping video for {package_dir}: {'; '.join(index.errors)}")
+                    continue
+                video_futures.append(video_pool.submit(assemble_video_from_package, package_dir, story if subs else None, video_backend, index))
+
+        for future in video_futures:
+            future.result()
+    finally:
+        if video_pool is not None:
+            video_pool.shutdown()
+        if owned_context:
+            context.close()
+
+def iter_packages(substories):
+    """
+    Creates the package folder of every substory whose video is not assembled yet.
+    Yields (package_dir, story) tuples.
+    """
+    for script_name, story in substories:
+        if os.path.isdir(f"data_output/ready/{make_package_id(script_name, story)}"):
+            continue  # Video already assembled on a previous run.
+        package_dir = create_package(script_name, story)
+        print(f"Scheduling {package_dir}: {story.get('title')}")
+        yield package_dir, story
+
+def process_one_script(json_script_path: str, json_script, skip_video=False, subs=True, **scheduler_options):
     """
-    Given one processed script JSON path, read it, create a unique package folder,
-    generate images and audio for sub-stories, and optionally do video assembly.
+    Given one processed script JSON path, read it, create a unique package folder
+    per sub-story, generate images and audio for them, and optionally do video assembly.
     Instead of saving the entire script, this version saves only the substory.
     It also uses the original json_script_path to determine the file name.
+    See process_all_scripts for the scheduler options.
     """
+    if isinstance(json_script, str):
+        json_script = json.loads(json_script)
     # Use the original file name from the provided path.
     original_file_name = os.path.basename(json_script_path)
-    
-    for story in json_script["substories"]:
-        uid = str(uuid4())
-        package_dir = f"data_output/packages/{uid}"
-        Path(package_dir).mkdir(parents=True, exist_ok=True)
-
-        # Save just the substory into a file using the original file name in the package folder.
-        subscript_path = os.path.join(package_dir, original_file_name)
-        with open(subscript_path, "w", encoding="utf-8") as f:
-            json.dump(story, f, indent=4)
-        
-        # Generate images for the substory.
-        generate_images_for_stories(package_dir, story)
-        
-        # Generate TTS audio for the substory.
-        generate_audio_for_stories(package_dir, story)
-        
-        # Assemble video if not skipping.
+    substories = [(original_file_name, story) for story in json_script["substories"]]
+    process_all_scripts(substories, skip_video=skip_video, subs=subs, **scheduler_options)
+
+
+# ---------------------------------------------------------------------------
+# Queue mode: stages as jobs drained by worker processes
+# ---------------------------------------------------------------------------
+def enqueue_scripts(substories, queue, skip_video=False, subs=True):
+    """
+    Adds an images, tts and (unless skipped) video job for every package to the queue.
+    Workers started with `content_pipeline.py worker` drain it.
+    """
+    packages = list(iter_packages(substories))
+    for package_dir, story in packages:
+        queue.enqueue(package_dir, "images", {"story": story})
+        queue.enqueue(package_dir, "tts", {"story": story})
         if not skip_video:
-            if subs:
-                assemble_video_from_package(package_dir, story)
-            else:
-                assemble_video_from_package(package_dir)
+            queue.enqueue(package_dir, "video", {"story": story if subs else None})
+    print(f"Queued {len(packages)} packages: {queue.counts()}")
+
+def run_job(job, context, image_concurrency=4, tts_workers=4, video_backend="moviepy"):
+    package_dir = job["package_dir"]
+    story = job["payload"]["story"]
+    if job["stage"] == "images":
+        generate_images_for_stories(package_dir, story, image_concurrency, image_generator=context.image_generator)
+    elif job["stage"] == "tts":
+        generate_audio_for_stories(package_dir, story, tts_workers, speech_generator=context.speech_generator)
+    elif job["stage"] == "video":
+        if not assemble_video_from_package(package_dir, story, video_backend, video_editor=context.video_editor(video_backend)):
+            raise RuntimeError(f"Video assembly failed for {package_dir}")
+
+def run_worker(queue, worker_id=None, image_concurrency=4, tts_workers=4, video_backend="moviepy",
+               poll_interval=5, forever=False, context=None):
+    """
+    Leases and runs jobs until the queue has no pending or leased job left (or forever).
+    The lease is renewed in the background while a job runs, so long renders are not handed to another worker.
+    Every job of the worker shares the generators of `context`.
+    """
+    worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+    print(f"Worker {worker_id} started on {queue.path}")
+    if context is None:
+        context = Pipeline_Context(image_concurrency=image_concurrency, tts_workers=tts_workers)
 
+    while True:
+        job = queue.lease(worker_id)
+        if job is None:
+            if not forever and not queue.has_unfinished_jobs():
+                break
+            time.sleep(poll_interval)
+            continue
+
+        print(f"[{worker_id}] {job['stage']} for {job['package_dir']} (attempt {job['attempts']})")
+        finished = threading.Event()
+
+        def keep_lease():
+            while not finished.wait(queue.lease_seconds / 3):
+                queue.heartbeat(job["id"], worker_id)
+
+        heartbeat = threading.Thread(target=keep_lease, daemon=True)
+        heartbeat.start()
+        try:
+            run_job(job, context, image_concurrency, tts_workers, video_backend)
+            queue.complete(job["id"], worker_id)
+        except Exception as e:
+            print(f"[{worker_id}] {job['stage']} for {job['package_dir']} failed: {e}")
+            queue.fail(job["id"], worker_id, e)
+        finally:
+            finished.set()
+            heartbeat.join()
+
+    print(f"Worker {worker_id} done: {queue.counts()}")
+    for dead in queue.dead_letters():
+        print(f"Dead letter: {dead['stage']} for {dead['package_dir']}: {dead['last_error']}")
 
 # ---------------------------------------------------------------------------
 # 7. Assemble videos for "ready" packages only
 # ---------------------------------------------------------------------------
-def assemble_ready_packages(packages_dir="data_output/packages"):
+def assemble_ready_packages(packages_dir="data_output/packages", video_backend="moviepy"):
     """
     Scans packages_dir for all subfolders and assembles video if the folder contains script, images and audio.
     """
@@ -139,33 +385,43 @@ def assemble_ready_packages(packages_dir="data_output/packages"):
     all_packages = [p for p in all_packages if os.path.isdir(p)]
 
     for package_path in all_packages:
-        if is_ready_for_video(package_path):
+        index = Package_Index(package_path)
+        if is_ready_for_video(package_path, index):
             print(f"Assembling video in: {package_path}")
-            assemble_video_from_package(package_path)
+            assemble_video_from_package(package_path, video_backend=video_backend, index=index)
         else:
-            print(f"Skipping (not ready): {package_path}")
+            print(f"Skipping (not ready): {package_path} {'; '.join(index.errors)}")
 
-def is_ready_for_video(package_dir: str):
+def is_ready_for_video(package_dir: str, index=None):
     """
-    Placeholder readiness check logic.
-    Checks for script.json, non-empty images and audio.
+    Checks for the substory json and that every image_{i}.png has a matching audio_{i}.mp3,
+    using the package's Package_Index. The substory is saved under its script's name (see create_package),
+    so it is any json file but the manifest, which every package gets as soon as one stage is recorded.
     """
-    script_file = os.path.join(package_dir, "script.json")
-    images_dir = os.path.join(package_dir, "images")
-    audio_dir = os.path.join(package_dir, "audio")
-
-    if not os.path.isfile(script_file):
+    if not any(file_name.endswith(".json") and file_name != MANIFEST_FILE for file_name in os.listdir(package_dir)):
         return False
-    if not os.path.isdir(images_dir) or len(os.listdir(images_dir)) == 0:
-        return False
-    if not os.path.isdir(audio_dir) or len(os.listdir(audio_dir)) == 0:
-        return False
-    
-    return True
+
+    if index is None:
+        index = Package_Index(package_dir)
+    return index.is_valid()
 
 # ---------------------------------------------------------------------------
 # Main Pipeline
 # ---------------------------------------------------------------------------
+EPUB_PATH = os.path.abspath("./data_source/epdf.pub_priests-of-mars2630113e4568e40991a57be123f3e78049575.epub")
+FAKE_RUN_DIR = "data_output/fake_run"
+
+def get_flag_value(args, flag, default, cast=int):
+    """
+    Returns the value of a flag given as "--flag value" or "--flag=value", or default.
+    """
+    for i, arg in enumerate(args):
+        if arg == flag and i + 1 < len(args):
+            return cast(args[i + 1])
+        if arg.startswith(flag + "="):
+            return cast(arg.split("=", 1)[1])
+    return default
+
 def main():
     """
     Possible flags:
@@ -177,16 +433,89 @@ def main():
     Additional flags:
       --skip-video  => skip final video assembly (if used with -sitv, it overrides the video step)
       --video-only  => only assemble videos for "ready" packages
+      --queue       => add image/tts/video jobs to the job queue instead of running them
+      --stream-chapters => start creating scripts while later chapters are still being extracted
+
+    Concurrency flags (value given as "--flag N" or "--flag=N"):
+      --package-workers    => packages generating images/audio at the same time (default 2)
+      --image-concurrency  => image requests in flight per package (default 4)
+      --tts-workers        => TTS requests in flight per package (default 4)
+      --video-workers      => processes rendering videos (default: CPU count)
+      --script-workers     => chat requests in flight while creating scripts (default 4)
+      --script-format      => "json" (structured output, default) or "text" (markdown parsed by Script_Processor)
+      --chapters-per-request => short chapters packed into one script request (default 4, 1 disables packing)
+      --extract-workers    => processes parsing and tokenizing chapters (default: CPU count)
+      --html-backend       => "soup" (reference, default) or "stream" (single pass) chapter text extraction
+      --video-backend      => "moviepy" (default) or "ffmpeg" (frames piped straight into ffmpeg)
+      --queue-path         => job queue database (default data_output/jobs.sqlite)
+
+    Offline runs:
+      --fake-openai        => send every API call to fake_openai.Fake_OpenAI (FAKE_OPENAI_LATENCY etc. tune it),
+                              reading and writing data_output/fake_run/data_output instead of data_output
+
+    Instrumentation flags:
+      --trace PATH         => write a JSONL span trace (timings, tokens, cost) and print a summary at the end
+      --chrome-trace PATH  => also export the trace for chrome://tracing or Perfetto
+
+    Worker mode, run in as many processes or hosts as needed to drain the queue:
+      content_pipeline.py worker [--queue-path PATH] [--worker-id ID] [--forever] [--retry-dead]
+      --retry-dead => requeue the dead letters first (rerunning --queue also requeues them)
     """
-    
-    epub_path = "./data_source/epdf.pub_priests-of-mars2630113e4568e40991a57be123f3e78049575.epub"
-    model_name = "gpt-4o"
     args = sys.argv[1:]
+    # Paths given on the command line stay relative to where the pipeline was started, even in a fake run.
+    queue_path = get_flag_value(args, "--queue-path", None, cast=os.path.abspath)
+    trace_path = get_flag_value(args, "--trace", None, cast=os.path.abspath)
+    chrome_trace_path = get_flag_value(args, "--chrome-trace", None, cast=os.path.abspath)
+    if "--fake-openai" in args or os.environ.get("OPENAI_BACKEND") == "fake":
+        os.environ["OPENAI_BACKEND"] = "fake"  # Read by openai_client.make_client, also in worker processes.
+        enter_fake_run_dir()
+    queue_path = queue_path or "data_output/jobs.sqlite"
+
+    if trace_path is not None:
+        tracer.configure(trace_path)
+    try:
+        run_pipeline(args, queue_path)
+    finally:
+        if trace_path is not None and os.path.exists(trace_path):
+            spans = load_trace(trace_path)
+            summarize(spans)
+            if chrome_trace_path is not None:
+                print(f"Chrome trace written to {export_chrome_trace(spans, chrome_trace_path)}")
+
+def enter_fake_run_dir():
+    """
+    Fake runs work in a data_output tree of their own under FAKE_RUN_DIR, so their synthetic scripts,
+    packages and cached assets are never picked up by a real run.
+    """
+    for folder in ["scripts", "processed_scripts", "used_scripts", "packages", "ready"]:
+        Path(FAKE_RUN_DIR, "data_output", folder).mkdir(parents=True, exist_ok=True)
+    os.chdir(FAKE_RUN_DIR)
+    print(f"Fake OpenAI run, working in {os.getcwd()}/data_output")
+
+def run_pipeline(args, queue_path):
+    epub_path = EPUB_PATH
+    model_name = "gpt-4o"
+
+    image_concurrency = get_flag_value(args, "--image-concurrency", 4)
+    tts_workers = get_flag_value(args, "--tts-workers", 4)
+
+    if args and args[0] == "worker":
+        if "--retry-dead" in args:
+            print(f"Requeued {Job_Queue(queue_path).requeue_dead()} dead jobs.")
+        with Pipeline_Context(image_concurrency=image_concurrency, tts_workers=tts_workers) as context:
+            run_worker(Job_Queue(queue_path),
+                       worker_id=get_flag_value(args, "--worker-id", None, cast=str),
+                       image_concurrency=image_concurrency,
+                       tts_workers=tts_workers,
+                       video_backend=get_flag_value(args, "--video-backend", "moviepy", cast=str),
+                       forever="--forever" in args,
+                       context=context)
+        return
 
     # Check for "video-only" mode
     if "--video-only" in args:
         print("Video-only mode: assembling videos for ready packages...")
-        assemble_ready_packages("data_output/packages")
+        assemble_ready_packages("data_output/packages", video_backend=get_flag_value(args, "--video-backend", "moviepy", cast=str))
         return
 
     # If any feature flags are provided, only enable the ones specified.
@@ -202,23 +531,41 @@ def main():
     # If user wants to skip video (overrides do_video)
     skip_video = "--skip-video" in args
 
-    # 1) Extract chapters & create scripts if needed
-    if do_scripts:
-        chapters = extract_chapters(epub_path, model_name=model_name, display_info=True)
-        create_scripts(chapters)
-        if args == ["-s"]:
-            print("Scripts generated. Exiting.")
-            return
+    scheduler_options = {
+        "package_workers": get_flag_value(args, "--package-workers", 2),
+        "image_concurrency": image_concurrency,
+        "tts_workers": tts_workers,
+        "video_workers": get_flag_value(args, "--video-workers", None),
+        "video_backend": get_flag_value(args, "--video-backend", "moviepy", cast=str),
+    }
+
+    # One client, connection pool and set of generators for the whole run. Queueing jobs needs no API access.
+    needs_api = do_scripts or ("--queue" not in args and (do_images or do_tts or do_video))
+    context = Pipeline_Context(image_concurrency=image_concurrency, tts_workers=tts_workers,
+                               script_format=get_flag_value(args, "--script-format", "json", cast=str)) if needs_api else None
+    with context or contextlib.nullcontext():
+        # 1) Extract chapters & create scripts if needed
+        if do_scripts:
+            chapters = extract_chapters(epub_path, model_name=model_name, display_info=True,
+                                        stream="--stream-chapters" in args,
+                                        workers=get_flag_value(args, "--extract-workers", None),
+                                        backend=get_flag_value(args, "--html-backend", "soup", cast=str))
+            create_scripts(chapters, script_generator=context.script_generator, max_workers=get_flag_value(args, "--script-workers", 4),
+                           chapters_per_request=get_flag_value(args, "--chapters-per-request", MAX_CHAPTERS_PER_REQUEST))
+            if args == ["-s"]:
+                print("Scripts generated. Exiting.")
+                return
     
-    # 2) Process scripts into JSON
-    processed_script_paths = process_scripts(input_dir="data_output/scripts")
+        # 2) Process scripts into JSON, substories come out one at a time as they are parsed
+        substories = process_scripts(input_dir="data_output/scripts")
     
-    # 3) For each processed script, create packages with images & audio
-    #    If do_video is true AND skip_video is false => assemble videos too
-    if do_images or do_tts or do_video:
-        for (text, json_script_path) in processed_script_paths:
-            print(text)
-            process_one_script(json_script_path, text, skip_video=(skip_video or not do_video))
+        # 3) For each processed script, create packages with images & audio
+        #    If do_video is true AND skip_video is false => assemble videos too
+        if "--queue" in args:
+            enqueue_scripts(substories, Job_Queue(queue_path), skip_video=(skip_video or not do_video))
+        elif do_images or do_tts or do_video:
+            process_all_scripts(substories, skip_video=(skip_video or not do_video),
+                                context=context, **scheduler_options)
             # Explanation:
             #  - skip_video is True if user gave --skip-video
             #  - do_video is False if they didn't specify -sitv
@@ -0,0 +1,166 @@
+"""
+Local stand-in for the OpenAI client, used by the benchmarks and to run the pipeline without network access.
+It exposes the three calls the generators make (chat.completions.create, images.generate, audio.speech.create)
+with configurable latency and failure rates, and returns deterministic payloads:
+scripts as JSON substories or in the format Script_Processor parses, PNG images and silent MP3 files sized to the narration.
+"""
+import io
+import os
+import re
+import json
+import base64
+import hashlib
+import threading
+import time
+import random as rd
+from types import SimpleNamespace
+from functools import lru_cache
+
+import httpx
+import openai
+
+# MPEG-1 Layer III, 32kbps, 48kHz, mono: 96 byte frames of 24ms. All-zero side info decodes as silence.
+SILENT_MP3_FRAME = bytes([0xFF, 0xFB, 0x14, 0xC4]) + bytes(92)
+MP3_FRAME_SECONDS = 1152 / 48000
+WORDS_PER_SECOND = 2.5
+
+SCENES = ["a starship drifting above a red planet", "a cathedral of brass machinery", "a storm over an ocean world",
+          "an ancient library lit by candles", "a forge city under a burning sky", "a crew gathered on a dim bridge"]
+
+
+def fake_request(method, path):
+    return httpx.Request(method, f"https://fake.openai.local/v1/{path}")
+
+
+@lru_cache(maxsize=64)
+def synthetic_png(seed, size="1024x1024"):
+    """ A smooth gradient, so encoding the generated images costs about as much as real artwork. """
+    import numpy as np
+    from PIL import Image
+
+    width, height = (int(value) for value in size.split("x"))
+    rng = np.random.default_rng(seed)
+    gradient = np.linspace(0, 200, width, dtype=np.float32)[None, :, None] + np.linspace(0, 55, height, dtype=np.float32)[:, None, None]
+    pixels = np.clip(gradient * rng.uniform(0.3, 1.0, size=3), 0, 255).astype(np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, format="PNG", compress_level=1)
+    return buffer.getvalue()
+
+
+def synthetic_mp3(seconds):
+    return SILENT_MP3_FRAME * max(1, round(seconds / MP3_FRAME_SECONDS))
+
+
+def synthetic_substories(seed, num_scripts=3, chunks=5):
+    rng = rd.Random(seed)
+    substories = []
+    for story in range(num_scripts):
+        substories.append({
+            "title": f"Fake Story {seed % 1000}-{story}",
+            "lines": [" ".join(rng.choice(SCENES).split() * 2) + f", part {i + 1} of the tale." for i in range(chunks)],
+            "prompts": [f"{rng.choice(SCENES)}, cinematic lighting." for _ in range(chunks)],
+            "general_prompt": f"{rng.choice(SCENES)}, painted in a consistent style.",
+        })
+    return substories
+
+
+def synthetic_script(seed, num_scripts=3, chunks=5):
+    """ The substories of synthetic_substories in the text format of the scriptwriter prompt. """
+    return "\n\n".join("\n".join(
+        [f"**Substory Title**: {substory['title']}", "", "**Script**:"] +
+        [f"Chunk {i + 1}: {line}" for i, line in enumerate(substory["lines"])] +
+        ["", "**Image Prompts**:"] +
+        [f"Chunk {i + 1} Prompt: {prompt}" for i, prompt in enumerate(substory["prompts"])] +
+        ["", f"**General Script Prompt**: {substory['general_prompt']}"])
+        for substory in synthetic_substories(seed, num_scripts, chunks))
+
+
+def count_tokens(text):
+    # Close enough to tiktoken for English prose, and needs no encoding download.
+    return max(1, len(text) // 4)
+
+
+class Fake_OpenAI():
+    """
+    latency: seconds each request takes, either a number or a (low, high) range drawn uniformly.
+    failure_rate: probability a request fails with a transient error (rate limit or connection error).
+    policy_failure_rate: probability an image or speech request is rejected by the content policy.
+    Every outcome is drawn from `seed`, so a benchmark sees the same sequence of failures on every run.
+    """
+
+    def __init__(self, latency=0.0, failure_rate=0.0, policy_failure_rate=0.0, seed=0):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.policy_failure_rate = policy_failure_rate
+        self.rng = rd.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = {"chat": 0, "images": 0, "speech": 0}
+        self.failures = 0
+
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create_chat_completion))
+        self.images = SimpleNamespace(generate=self.generate_image)
+        self.audio = SimpleNamespace(speech=SimpleNamespace(create=self.create_speech))
+
+    @classmethod
+    def from_env(cls):
+        """ Reads FAKE_OPENAI_LATENCY, FAKE_OPENAI_FAILURE_RATE, FAKE_OPENAI_POLICY_FAILURE_RATE and FAKE_OPENAI_SEED. """
+        return cls(latency=float(os.environ.get("FAKE_OPENAI_LATENCY", 0.0)),
+                   failure_rate=float(os.environ.get("FAKE_OPENAI_FAILURE_RATE", 0.0)),
+                   policy_failure_rate=float(os.environ.get("FAKE_OPENAI_POLICY_FAILURE_RATE", 0.0)),
+                   seed=int(os.environ.get("FAKE_OPENAI_SEED", 0)))
+
+    def simulate(self, endpoint, path, can_violate_policy=False):
+        """ Waits out the latency, then raises the same exceptions the real client would for a failed request. """
+        with self.lock:
+            self.requests[endpoint] += 1
+            latency = self.rng.uniform(*self.latency) if isinstance(self.latency, (tuple, list)) else self.latency
+            roll = self.rng.random()
+            transient_error = self.rng.random() < 0.5
+        time.sleep(latency)
+
+        request = fake_request("POST", path)
+        if roll < self.failure_rate:
+            with self.lock:
+                self.failures += 1
+            if transient_error:
+                response = httpx.Response(429, request=request, headers={"retry-after": "1"})
+                raise openai.RateLimitError("Rate limit reached (fake)", response=response, body=None)
+            raise openai.APIConnectionError(request=request)
+        if can_violate_policy and roll < self.failure_rate + self.policy_failure_rate:
+            with self.lock:
+                self.failures += 1
+            body = {"code": "content_policy_violation", "message": "Your request was rejected by the safety system (fake)."}
+            raise openai.BadRequestError(body["message"], response=httpx.Response(400, request=request), body=body)
+
+    def create_chat_completion(self, model, messages, max_tokens=None, response_format=None, **kwargs):
+        """ Answers a json_schema response_format with JSON substories, and cuts the output off at max_tokens like the API. """
+        self.simulate("chat", "chat/completions")
+        system_message, user_prompt = messages[0]["content"], messages[-1]["content"]
+        seed = int(hashlib.sha256(user_prompt.encode("utf-8")).hexdigest()[:8], 16)
+        chapters = re.findall(r"=== CHAPTER (\d+) START", user_prompt)
+        if "scriptwriter" in system_message and response_format is not None and chapters:
+            # Packed request: substories for every chapter, tagged with its number.
+            content = json.dumps({"substories": [dict(substory, chapter=int(n)) for n in chapters
+                                                 for substory in synthetic_substories(seed + int(n))]})
+        elif "scriptwriter" in system_message and response_format is not None:
+            content = json.dumps({"substories": synthetic_substories(seed)})
+        elif "scriptwriter" in system_message:
+            content = synthetic_script(seed)
+        else:
+            content = f"A gentler retelling: {rd.Random(seed).choice(SCENES)}."
+        finish_reason = "stop"
+        if max_tokens is not None and count_tokens(content) > max_tokens:
+            content, finish_reason = content[:max_tokens * 4], "length"
+        usage = SimpleNamespace(prompt_tokens=count_tokens(system_message + user_prompt), completion_tokens=count_tokens(content))
+        usage.total_tokens = usage.prompt_tokens + usage.completion_tokens
+        return SimpleNamespace(model=model, usage=usage,
+                               choices=[SimpleNamespace(message=SimpleNamespace(role="assistant", content=content), finish_reason=finish_reason)])
+
+    def generate_image(self, model, prompt, size="1024x1024", quality="standard", response_format="b64_json", n=1, **kwargs):
+        self.simulate("images", "images/generations", can_violate_policy=True)
+        seed = int(hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:8], 16) % 16
+        return SimpleNamespace(data=[SimpleNamespace(b64_json=base64.b64encode(synthetic_png(seed, size)).decode("ascii"))])
+
+    def create_speech(self, model, voice, input, **kwargs):
+        self.simulate("speech", "audio/speech", can_violate_policy=True)
+        return SimpleNamespace(content=synthetic_mp3(max(1.0, len(input.split()) / WORDS_PER_SECOND)))
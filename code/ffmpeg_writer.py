@@ -0,0 +1,163 @@
+import os
+import tempfile
+import subprocess
+
+import numpy as np
+
+
+def get_ffmpeg_binary():
+    """
+    Uses FFMPEG_BINARY if set, otherwise the binary bundled with imageio-ffmpeg (installed with moviepy).
+    """
+    if os.environ.get("FFMPEG_BINARY"):
+        return os.environ["FFMPEG_BINARY"]
+    try:
+        import imageio_ffmpeg
+        return imageio_ffmpeg.get_ffmpeg_exe()
+    except (ImportError, RuntimeError):
+        return "ffmpeg"
+
+
+def write_concat_list(paths, list_path):
+    """ Writes a file list for ffmpeg's concat demuxer. """
+    with open(list_path, "w", encoding="utf-8") as list_file:
+        for path in paths:
+            escaped = os.path.abspath(path).replace("'", "'\\''")
+            list_file.write(f"file '{escaped}'\n")
+    return list_path
+
+
+def video_encoder_args(codec="libx264", preset="medium", crf=23, threads=None):
+    """ Output options shared by every encoded segment, so segments can be concatenated without re-encoding. """
+    args = ["-c:v", codec, "-preset", preset, "-crf", str(crf), "-pix_fmt", "yuv420p"]
+    if threads is not None:
+        args += ["-threads", str(threads)]
+    return args
+
+
+def run_ffmpeg(args):
+    result = subprocess.run([get_ffmpeg_binary(), "-y", "-loglevel", "error"] + args, capture_output=True)
+    if result.returncode != 0:
+        error = result.stderr.decode("utf-8", errors="replace")
+        raise RuntimeError(f"ffmpeg failed with exit code {result.returncode}: {error}")
+
+
+def encode_still(frame, num_frames, output_path, fps=24, unit_frames=12, **encoder_options):
+    """
+    Encodes a single frame held for `num_frames` frames at a cost that does not grow with `num_frames`.
+    A `unit_frames` long segment is piped and encoded once and listed as many times as it fits, only the
+    remainder is encoded on its own, so at most 2 * unit_frames frames are encoded per still.
+    Returns the segment paths, in order, for concat_segments (which copies the stream, the repeats cost nothing).
+    """
+    height, width = frame.shape[:2]
+
+    def encode(path, count):
+        with FFmpeg_Writer(path, width, height, fps=fps, **encoder_options) as writer:
+            for _ in range(count):
+                writer.write_frame(frame)
+        return path
+
+    repeats, remainder = divmod(num_frames, unit_frames)
+    segment_paths = []
+    if repeats:
+        segment_paths += [encode(f"{output_path}.unit.mp4", unit_frames)] * repeats
+    if remainder:
+        segment_paths.append(encode(f"{output_path}.rest.mp4", remainder))
+    return segment_paths
+
+
+def concat_segments(segment_paths, output_path, audio_files=None, audio_codec="aac"):
+    """
+    Joins encoded segments with the concat demuxer, copying the video stream, and muxes the concatenated audio.
+    """
+    with tempfile.TemporaryDirectory() as list_dir:
+        args = ["-f", "concat", "-safe", "0", "-i", write_concat_list(segment_paths, os.path.join(list_dir, "video.txt"))]
+        if audio_files:
+            args += ["-f", "concat", "-safe", "0", "-i", write_concat_list(audio_files, os.path.join(list_dir, "audio.txt")),
+                     "-map", "0:v", "-map", "1:a", "-c:a", audio_codec]
+        run_ffmpeg(args + ["-c:v", "copy", output_path])
+    return output_path
+
+
+class FFmpeg_Writer():
+    """
+    Streams raw RGB frames into an ffmpeg subprocess over stdin, so memory stays flat whatever the video length.
+    The audio files are concatenated by ffmpeg's concat demuxer and muxed in the same process.
+
+    Usage:
+        with FFmpeg_Writer("video.mp4", 1080, 1920, audio_files=[...]) as writer:
+            for frame in frames:
+                writer.write_frame(frame)
+    """
+
+    def __init__(self, output_path, width, height, fps=24, audio_files=None,
+                 codec="libx264", preset="medium", crf=23, threads=None, audio_codec="aac"):
+        self.output_path = output_path
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.audio_files = audio_files or []
+        self.codec = codec
+        self.preset = preset
+        self.crf = crf
+        self.threads = threads
+        self.audio_codec = audio_codec
+        self.frames_written = 0
+        self.process = None
+
+    def build_command(self, audio_list_path=None):
+        command = [
+            get_ffmpeg_binary(), "-y", "-loglevel", "error",
+            "-f", "rawvideo", "-pix_fmt", "rgb24",
+            "-s", f"{self.width}x{self.height}", "-r", str(self.fps),
+            "-i", "-",
+        ]
+        if audio_list_path is not None:
+            command += ["-f", "concat", "-safe", "0", "-i", audio_list_path, "-map", "0:v", "-map", "1:a", "-c:a", self.audio_codec]
+        command += video_encoder_args(self.codec, self.preset, self.crf, self.threads)
+        command.append(self.output_path)
+        return command
+
+    def open(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        audio_list_path = None
+        if self.audio_files:
+            audio_list_path = write_concat_list(self.audio_files, os.path.join(self.temp_dir.name, "audio.txt"))
+
+        # stderr goes to a file so a chatty ffmpeg can never block on a full pipe.
+        self.log = open(os.path.join(self.temp_dir.name, "ffmpeg.log"), "w+b")
+        self.process = subprocess.Popen(self.build_command(audio_list_path), stdin=subprocess.PIPE, stderr=self.log)
+        return self
+
+    def write_frame(self, frame):
+        if frame.shape[:2] != (self.height, self.width):
+            raise ValueError(f"Frame of shape {frame.shape} does not match {self.width}x{self.height}")
+        self.process.stdin.write(np.ascontiguousarray(frame, dtype=np.uint8).data)
+        self.frames_written += 1
+
+    def close(self):
+        try:
+            self.process.stdin.close()
+            return_code = self.process.wait()
+            if return_code != 0:
+                self.log.seek(0)
+                error = self.log.read().decode("utf-8", errors="replace")
+                raise RuntimeError(f"ffmpeg failed with exit code {return_code}: {error}")
+        finally:
+            self.log.close()
+            self.temp_dir.cleanup()
+
+    def abort(self):
+        self.process.kill()
+        self.process.wait()
+        self.log.close()
+        self.temp_dir.cleanup()
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            self.abort()
+            return False
+        self.close()
@@ -0,0 +1,104 @@
+from html.parser import HTMLParser
+from bs4 import BeautifulSoup
+
+TITLE_TAGS = ["h1", "h2", "h3", "title"]
+# Text inside these tags is not part of the chapter, BeautifulSoup's get_text() skips it as well.
+SKIPPED_TAGS = {"script", "style", "template"}
+
+
+def extract_title(soup):
+    for tag in TITLE_TAGS:
+        title = soup.find(tag)
+        if title:
+            return title.get_text(strip=True)
+    return "Untitled chapter"
+
+
+class Soup_Text_Backend():
+    """
+    Reference backend: builds a full BeautifulSoup tree, then searches it for the title and the text.
+    """
+    name = "soup"
+
+    def extract(self, html):
+        """ Returns (title, text) for one epub document. """
+        soup = BeautifulSoup(html, 'html.parser')
+        return extract_title(soup), soup.get_text()
+
+
+class Title_Text_Parser(HTMLParser):
+    """
+    SAX style parser collecting the body text and the first h1/h2/h3/title texts in a single pass, without building a tree.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.text_parts = []
+        self.title_parts = {}
+        self.open_titles = {}
+        self.skip_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in SKIPPED_TAGS:
+            self.skip_depth += 1
+        elif tag in TITLE_TAGS and tag not in self.title_parts:
+            self.title_parts[tag] = []
+            self.open_titles[tag] = 0
+        elif tag in self.open_titles:
+            self.open_titles[tag] += 1
+
+    def handle_endtag(self, tag):
+        if tag in SKIPPED_TAGS:
+            self.skip_depth = max(0, self.skip_depth - 1)
+        elif tag in self.open_titles:
+            if self.open_titles[tag] == 0:
+                del self.open_titles[tag]
+            else:
+                self.open_titles[tag] -= 1
+
+    def handle_data(self, data):
+        if self.skip_depth:
+            return
+        self.text_parts.append(data)
+        for tag in self.open_titles:
+            self.title_parts[tag].append(data)
+
+    def title(self):
+        for tag in TITLE_TAGS:
+            if tag in self.title_parts:
+                # Same as get_text(strip=True): every string stripped, empty ones dropped.
+                return "".join(part.strip() for part in self.title_parts[tag])
+        return "Untitled chapter"
+
+
+class Stream_Text_Backend():
+    """
+    Fast backend: one streaming pass with the standard library parser yields both the title and the text.
+    Documents that are not valid UTF-8 go through the reference backend, which detects their encoding.
+    """
+    name = "stream"
+
+    def extract(self, html):
+        """ Returns (title, text) for one epub document. """
+        if isinstance(html, bytes):
+            try:
+                html = html.decode("utf-8")
+            except UnicodeDecodeError:
+                return Soup_Text_Backend().extract(html)
+
+        parser = Title_Text_Parser()
+        parser.feed(html)
+        parser.close()
+        return parser.title(), "".join(parser.text_parts)
+
+
+TEXT_BACKENDS = {
+    Soup_Text_Backend.name: Soup_Text_Backend,
+    Stream_Text_Backend.name: Stream_Text_Backend,
+}
+
+
+def get_text_backend(name="soup"):
+    if name not in TEXT_BACKENDS:
+        raise ValueError(f"Unknown HTML text backend '{name}', expected one of {list(TEXT_BACKENDS)}")
+    return TEXT_BACKENDS[name]()
@@ -1,48 +1,94 @@
 import json
 import base64
-from pathlib import Path
-from openai import OpenAI
-from dotenv import dotenv_values
+from concurrent.futures import ThreadPoolExecutor
+from openai_client import make_client, cache_dir
 import script_creation
+from cache import Disk_Cache, replace_file
+from tracing import tracer, image_cost
+from rate_limiter import get_scheduler, classify_error, CONTENT_POLICY
 
 class Image_Generator():
 
-    def __init__(self):
-        config = dotenv_values(".env")
-        self.client = OpenAI(api_key=config.get("API_KEY"), project=config.get("PROJECT_ID"))
-        self.sc = script_creation.Script_Generator()
+    def __init__(self, client=None, max_in_flight=4, cache=None, scheduler=None, script_generator=None):
+        """
+        client: optional OpenAI compatible client, e.g. a local fake for testing.
+        max_in_flight: maximum number of image requests sent at the same time.
+        cache: Disk_Cache for generated images, defaults to cache_dir("images") capped at 2GB.
+        scheduler: rate_limiter.Request_Scheduler, defaults to the one shared by the whole process.
+        script_generator: Script_Generator used to rewrite rejected prompts, built on the same client by default.
+        """
+        if client is None:
+            client = make_client()
+        self.client = client
+        self.scheduler = scheduler or get_scheduler()
+        self.sc = script_generator or script_creation.Script_Generator(client=client, scheduler=self.scheduler)
+        self.max_in_flight = max_in_flight
+        if cache is None:
+            cache = Disk_Cache(cache_dir("images"), suffix=".png", max_bytes=2 * 1024**3)
+        self.cache = cache
+        self.model = "dall-e-3"
+        self.size = "1024x1024"
+        self.quality = "standard"
 
 
-    def generate_images(self, image_path, prompts, context):
+    def generate_images(self, image_path, prompts, context, max_in_flight=None):
+        """
+        Generates one image per prompt concurrently, keeping image_{i}.png aligned with prompts[i].
+        At most `max_in_flight` requests are sent at the same time to stay under rate limits.
+        """
+        if max_in_flight is None:
+            max_in_flight = self.max_in_flight
+        workers = max(1, min(max_in_flight, len(prompts)))
 
-        for i, prompt in enumerate(prompts):
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(tracer.wrap(self.generate_image_with_fallback), f"{image_path}/image_{i}.png", prompt, context)
+                for i, prompt in enumerate(prompts)
+            ]
+            for future in futures:
+                future.result()
+
+
+    def generate_image_with_fallback(self, image_path, prompt, context):
+        with tracer.span("generate_image", path=image_path) as span:
             try:
-                self.generate_image(f"{image_path}/image_{i}.png", prompt, context)
+                self.generate_image(image_path, prompt, context)
             except Exception as e:
+                # Rate limits and transient errors were already retried by the scheduler,
+                # only a rejected prompt is worth rewriting.
+                if classify_error(e) != CONTENT_POLICY:
+                    raise
+                span.add("prompt_rewrites")
                 new_prompt = self.sc.regenerate_image_prompt(prompt)
-                self.generate_image(f"{image_path}/image_{i}.png", new_prompt, context)
-                 
-        
+                self.generate_image(image_path, new_prompt, context)
+
 
     def generate_image(self, image_path, prompt, context):
         full_prompt = f"{context} {prompt} Do not add text to the generated images"
 
-        response = self.client.images.generate(
-            model="dall-e-3",
+        # Identical requests were already paid for, reuse the cached image.
+        cache_key = Disk_Cache.make_key(self.model, self.size, self.quality, full_prompt)
+        if self.cache.link_into(cache_key, image_path):
+            tracer.add("cache_hits")
+            return
+
+        response = self.scheduler.call(
+            "images", self.client.images.generate,
+            model=self.model,
             prompt=full_prompt,
-            size="1024x1024",
-            quality="standard",
+            size=self.size,
+            quality=self.quality,
             response_format="b64_json",
             n=1
         )
-
-        image_path = Path(image_path)
+        tracer.add("cost_usd", image_cost(self.model, self.quality, self.size))
 
         image_data = base64.b64decode(response.data[0].b64_json)
-        image_path.parent.mkdir(parents=True, exist_ok=True)  # Create directories if needed
+        # image_path may still be a hard link to another prompt's cached image, replace it instead of writing into it.
+        replace_file(image_path, image_data)
+        tracer.add("bytes_written", len(image_data))
 
-        with open(image_path, "wb") as img_file:
-            img_file.write(image_data)
+        self.cache.put_bytes(cache_key, image_data)
 
 
 
@@ -1,8 +1,55 @@
-from bs4 import BeautifulSoup
+import os
 import ebooklib
 from ebooklib import epub
 from prettytable import PrettyTable
 import tiktoken
+from array import array
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor
+from html_text import extract_title, get_text_backend
+
+UNWANTED_TITLE_WORDS = ["license", "about", "untitled"]
+# TOKENIZER=bytes replaces the model's encoding with byte_encoding, read in worker processes as well.
+TOKENIZER_ENV = "TOKENIZER"
+
+
+def byte_encoding():
+    """
+    One token per byte. Needs no download, so offline runs (benchmarks) can still tokenize, but counts are not model tokens.
+    """
+    return tiktoken.Encoding("bytes", pat_str=r"\S+|\s+", mergeable_ranks={bytes([i]): i for i in range(256)}, special_tokens={})
+
+
+@lru_cache(maxsize=None)
+def get_encoding(model):
+    """
+    Returns the tiktoken encoding for the model, loaded once per process and shared by every chapter.
+    """
+    if os.environ.get(TOKENIZER_ENV) == "bytes":
+        return byte_encoding()
+    return tiktoken.encoding_for_model(model)
+
+
+def is_wanted_chapter(title, word_count, min_word_count=200):
+    """
+    Title and word count filter, cheap enough to run before a chapter is tokenized.
+    """
+    if any(word in title.lower() for word in UNWANTED_TITLE_WORDS):
+        return False
+    return word_count > min_word_count
+
+
+def parse_chapter(html, model, filter_chapters=True, min_word_count=200, backend="soup"):
+    """
+    Parses one epub document into a Chapter, or returns None if the filters drop it.
+    Runs in worker processes, so it only takes picklable arguments and the backend is given by name.
+    """
+    title, text = get_text_backend(backend).extract(html)
+
+    if filter_chapters and not is_wanted_chapter(title, len(text.split()), min_word_count):
+        return None
+    return Chapter(text, title, model)
+
 
 class Chapter:
     def __init__(self, text, title, model):
@@ -28,11 +75,19 @@ class Chapter:
     def get_token_count(self):
         return self.tokens_count
 
+    def get_tokens(self):
+        return self.tokens
+
+    def get_token_memory(self):
+        """ Bytes used by the stored token array. """
+        return self.tokens.itemsize * len(self.tokens)
+
     def count_tokens(self):
-        encoding = tiktoken.encoding_for_model(self.model)
-        tokens = encoding.encode(self.text)
+        # Kept as a compact uint32 array so chunking can slice it without encoding the text again.
+        encoding = get_encoding(self.model)
+        self.tokens = array('I', encoding.encode(self.text))
         
-        self.tokens_count = len(tokens)
+        self.tokens_count = len(self.tokens)
 
   
 class Character:
@@ -48,13 +103,21 @@ class Character:
 
 
 class Extract_Information:
-    def __init__(self, path, model):
+    def __init__(self, path, model, lazy=False, workers=None, backend="soup"):
+        """
+        lazy: skip extraction on construction, chapters are then produced by iter_chapters().
+        workers: processes used to parse and tokenize chapters, defaults to the CPU count.
+        backend: HTML to text backend from html_text.TEXT_BACKENDS, "soup" (reference) or "stream" (single pass).
+        """
         self.path = path
         self.text = ""
         self.chapters = []
         self.model = model
         self.characters = []
-        self.text = self.extract_information()
+        self.workers = workers
+        self.backend = backend
+        if not lazy:
+            self.text = self.extract_information()
 
     
     def extract_information(self):
@@ -63,26 +126,43 @@ class Extract_Information:
         return self.text
 
     def extract_title(self, soup):
-        for tag in ["h1", "h2", "h3", "title"]:
-            title = soup.find(tag)
-            if title:
-                return title.get_text(strip=True)
-        return "Untitled chapter"
+        return extract_title(soup)
 
     def ebook_to_text(self, filter_chapters=True):
+        self.chapters = []
+        for _ in self.iter_chapters(filter_chapters):
+            pass
+
+    def iter_chapters(self, filter_chapters=True, min_word_count=200):
+        """
+        Yields chapters in book order as soon as each one is parsed, so consumers can start
+        on chapter 1 while later chapters are still being processed. HTML parsing and tokenization
+        run across a process pool, and filtered chapters are dropped before they are tokenized.
+        Yielded chapters are also appended to self.chapters.
+        """
         book = epub.read_epub(self.path)
-        content = []
-
-        for item in book.get_items():
-            if item.get_type() == ebooklib.ITEM_DOCUMENT:
-                soup = BeautifulSoup(item.get_content(), 'html.parser')
-                title = self.extract_title(soup) 
-                 
-                content.append(Chapter(soup.get_text(), title, self.model))
-        
-        self.chapters = content
-        if filter_chapters:
-            self.filter_chapters()
+        documents = [item.get_content() for item in book.get_items() if item.get_type() == ebooklib.ITEM_DOCUMENT]
+        count = len(documents)
+        models = [self.model] * count
+        filters = [filter_chapters] * count
+        min_word_counts = [min_word_count] * count
+        backends = [self.backend] * count
+
+        if self.workers == 1:
+            chapters = map(parse_chapter, documents, models, filters, min_word_counts, backends)
+            yield from self.collect_chapters(chapters)
+            return
+
+        with ProcessPoolExecutor(max_workers=self.workers) as pool:
+            chapters = pool.map(parse_chapter, documents, models, filters, min_word_counts, backends)
+            yield from self.collect_chapters(chapters)
+
+    def collect_chapters(self, chapters):
+        for chapter in chapters:
+            if chapter is None:
+                continue
+            self.chapters.append(chapter)
+            yield chapter
 
     def get_chapters(self):
         return self.chapters
@@ -102,6 +182,12 @@ class Extract_Information:
             sizes.append(chapter.get_word_count())
         return sizes
 
+    def get_chapters_token_memory(self):
+        sizes = []
+        for chapter in self.chapters:
+            sizes.append(chapter.get_token_memory())
+        return sizes
+
     def get_chapters_titles(self):
         titles = []
         for chapter in self.chapters:
@@ -112,6 +198,7 @@ class Extract_Information:
         titles = self.get_chapters_titles()
         token_count = self.get_chapter_token_count()
         word_count = self.get_chapters_word_count()
+        token_memory = self.get_chapters_token_memory()
 
         info = zip(titles, token_count, word_count)
 
@@ -120,15 +207,14 @@ class Extract_Information:
             table.add_column("Chapter Name", titles)
             table.add_column("Token Count", token_count)
             table.add_column("Word Count", word_count)
+            table.add_column("Token Memory (KB)", [round(size / 1024, 1) for size in token_memory])
             print(table)
+            print(f"Total token memory: {sum(token_memory) / 1024**2:.2f} MB")
 
         return info
 
     def filter_chapters(self, min_word_count=200):
-        unwated_words = ["license", "about", "untitled"]
-        self.chapters = [chapter for chapter in self.chapters if not any(word in chapter.get_title().lower() for word in unwated_words)]
-
-        self.chapters = [chapter for chapter in self.chapters if chapter.get_word_count() > min_word_count]
+        self.chapters = [chapter for chapter in self.chapters if is_wanted_chapter(chapter.get_title(), chapter.get_word_count(), min_word_count)]
 
     
 
@@ -0,0 +1,175 @@
+import json
+import time
+import sqlite3
+from pathlib import Path
+from contextlib import contextmanager
+
+# A video job is only leased once the images and tts jobs of its package are done.
+STAGES = ["images", "tts", "video"]
+
+
+class Job_Queue():
+    """
+    Persistent job queue backed by SQLite, shared by any number of worker processes
+    (or hosts, when the database sits on a shared filesystem).
+    Jobs are leased for `lease_seconds`; a worker that dies loses its lease and the job is handed out again.
+    Failed jobs are retried with exponential backoff and moved to the dead letter status after `max_attempts`.
+    """
+
+    def __init__(self, path="data_output/jobs.sqlite", max_attempts=3, lease_seconds=600, retry_backoff=30):
+        self.path = path
+        self.max_attempts = max_attempts
+        self.lease_seconds = lease_seconds
+        self.retry_backoff = retry_backoff
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        with self.connect() as connection:
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    package_dir TEXT NOT NULL,
+                    stage TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'pending',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    available_at REAL NOT NULL DEFAULT 0,
+                    lease_owner TEXT,
+                    lease_expires REAL,
+                    last_error TEXT,
+                    updated_at REAL NOT NULL,
+                    UNIQUE (package_dir, stage)
+                )""")
+
+    @contextmanager
+    def connect(self):
+        # Autocommit mode, transactions are opened explicitly with BEGIN IMMEDIATE where needed.
+        connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        connection.row_factory = sqlite3.Row
+        try:
+            yield connection
+        finally:
+            connection.close()
+
+    def dead_letter_dependents(self, connection, now):
+        """ A video job can never run once its images or tts job is dead, so dead-letter it too. """
+        connection.execute(
+            "UPDATE jobs SET status = 'dead', last_error = 'dependency failed', updated_at = ? "
+            "WHERE stage = 'video' AND status = 'pending' AND package_dir IN "
+            "(SELECT package_dir FROM jobs WHERE status = 'dead' AND stage IN ('images', 'tts'))",
+            (now,))
+
+    def enqueue(self, package_dir, stage, payload):
+        """
+        Adds a job. If the package already has a job for this stage it is kept as is,
+        unless it is a dead letter, which starts over with the new payload and no attempts.
+        """
+        if stage not in STAGES:
+            raise ValueError(f"Unknown stage '{stage}', expected one of {STAGES}")
+        with self.connect() as connection:
+            connection.execute(
+                "INSERT INTO jobs (package_dir, stage, payload, updated_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (package_dir, stage) DO UPDATE SET status = 'pending', attempts = 0, available_at = 0, "
+                "payload = excluded.payload, last_error = NULL, lease_owner = NULL, lease_expires = NULL, updated_at = excluded.updated_at "
+                "WHERE jobs.status = 'dead'",
+                (package_dir, stage, json.dumps(payload), time.time()))
+
+    def requeue_dead(self, package_dir=None):
+        """ Gives dead letters (of one package, or all of them) a fresh set of attempts. Returns the number of jobs requeued. """
+        query = ("UPDATE jobs SET status = 'pending', attempts = 0, available_at = 0, last_error = NULL, "
+                 "lease_owner = NULL, lease_expires = NULL, updated_at = ? WHERE status = 'dead'")
+        params = [time.time()]
+        if package_dir is not None:
+            query += " AND package_dir = ?"
+            params.append(package_dir)
+        with self.connect() as connection:
+            return connection.execute(query, params).rowcount
+
+    def lease(self, worker_id):
+        """
+        Leases the next runnable job to `worker_id` and returns it as a dict, or None if nothing is runnable.
+        Jobs whose lease expired are runnable again; those out of attempts go to dead letters instead.
+        """
+        now = time.time()
+        with self.connect() as connection:
+            try:
+                connection.execute("BEGIN IMMEDIATE")
+                connection.execute(
+                    "UPDATE jobs SET status = 'dead', last_error = 'lease expired', updated_at = ? "
+                    "WHERE status = 'leased' AND lease_expires < ? AND attempts >= ?",
+                    (now, now, self.max_attempts))
+                self.dead_letter_dependents(connection, now)
+
+                row = connection.execute("""
+                    SELECT * FROM jobs AS job
+                    WHERE (job.status = 'pending' OR (job.status = 'leased' AND job.lease_expires < :now))
+                      AND job.available_at <= :now
+                      AND (job.stage != 'video' OR NOT EXISTS (
+                          SELECT 1 FROM jobs AS dependency
+                          WHERE dependency.package_dir = job.package_dir
+                            AND dependency.stage IN ('images', 'tts')
+                            AND dependency.status != 'done'))
+                    ORDER BY job.id
+                    LIMIT 1""", {"now": now}).fetchone()
+
+                if row is not None:
+                    connection.execute(
+                        "UPDATE jobs SET status = 'leased', attempts = attempts + 1, lease_owner = ?, lease_expires = ?, updated_at = ? "
+                        "WHERE id = ?",
+                        (worker_id, now + self.lease_seconds, now, row["id"]))
+                connection.execute("COMMIT")
+            except Exception:
+                connection.execute("ROLLBACK")
+                raise
+
+        if row is None:
+            return None
+
+        job = dict(row)
+        job["payload"] = json.loads(job["payload"])
+        job["attempts"] += 1
+        return job
+
+    def heartbeat(self, job_id, worker_id):
+        """ Extends the lease of a job the worker still holds. Returns False if the lease was lost. """
+        with self.connect() as connection:
+            cursor = connection.execute(
+                "UPDATE jobs SET lease_expires = ?, updated_at = ? WHERE id = ? AND lease_owner = ? AND status = 'leased'",
+                (time.time() + self.lease_seconds, time.time(), job_id, worker_id))
+            return cursor.rowcount == 1
+
+    def complete(self, job_id, worker_id):
+        with self.connect() as connection:
+            connection.execute(
+                "UPDATE jobs SET status = 'done', lease_owner = NULL, lease_expires = NULL, updated_at = ? "
+                "WHERE id = ? AND lease_owner = ?",
+                (time.time(), job_id, worker_id))
+
+    def fail(self, job_id, worker_id, error):
+        """ Schedules a retry with exponential backoff, or dead-letters the job once it is out of attempts. """
+        now = time.time()
+        with self.connect() as connection:
+            row = connection.execute("SELECT attempts FROM jobs WHERE id = ? AND lease_owner = ?", (job_id, worker_id)).fetchone()
+            if row is None:
+                return
+            if row["attempts"] >= self.max_attempts:
+                status, available_at = "dead", now
+            else:
+                status, available_at = "pending", now + self.retry_backoff * 2 ** (row["attempts"] - 1)
+            connection.execute(
+                "UPDATE jobs SET status = ?, available_at = ?, last_error = ?, lease_owner = NULL, lease_expires = NULL, updated_at = ? "
+                "WHERE id = ?",
+                (status, available_at, str(error), now, job_id))
+            self.dead_letter_dependents(connection, now)
+
+    def counts(self):
+        with self.connect() as connection:
+            rows = connection.execute("SELECT status, COUNT(*) AS total FROM jobs GROUP BY status").fetchall()
+        return {row["status"]: row["total"] for row in rows}
+
+    def has_unfinished_jobs(self):
+        counts = self.counts()
+        return counts.get("pending", 0) + counts.get("leased", 0) > 0
+
+    def dead_letters(self):
+        with self.connect() as connection:
+            rows = connection.execute("SELECT * FROM jobs WHERE status = 'dead' ORDER BY id").fetchall()
+        return [dict(row) for row in rows]
@@ -0,0 +1,48 @@
+import os
+import importlib.util
+from functools import lru_cache
+
+from openai import OpenAI, DefaultHttpxClient
+from dotenv import dotenv_values
+import httpx
+
+
+@lru_cache(maxsize=1)
+def load_config():
+    return dotenv_values(".env")
+
+
+def make_http_client(max_connections=32, keepalive_expiry=120):
+    """
+    A pooled HTTP client meant to be shared by every OpenAI request of the process, so connections
+    (and their TLS handshakes) are reused across requests and packages. Requests are multiplexed
+    over HTTP/2 when the h2 package is installed.
+    """
+    http2 = importlib.util.find_spec("h2") is not None
+    limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections,
+                          keepalive_expiry=keepalive_expiry)
+    return DefaultHttpxClient(http2=http2, limits=limits)
+
+
+def cache_dir(name):
+    """
+    Directory of a generator's response cache. Cache keys do not include the backend,
+    so the fake backend's synthetic responses get a tree of their own.
+    """
+    if os.environ.get("OPENAI_BACKEND") == "fake":
+        return f"data_output/cache/fake/{name}"
+    return f"data_output/cache/{name}"
+
+
+def make_client(http_client=None):
+    """
+    Returns the client every generator uses unless one is passed in.
+    OPENAI_BACKEND=fake returns a local fake_openai.Fake_OpenAI instead, so the pipeline runs without network access.
+    """
+    if os.environ.get("OPENAI_BACKEND") == "fake":
+        from fake_openai import Fake_OpenAI
+        return Fake_OpenAI.from_env()
+    config = load_config()
+    # rate_limiter.Request_Scheduler is the only retry layer, the SDK's own retries would multiply its attempts
+    # and bypass the token buckets.
+    return OpenAI(api_key=config.get("API_KEY"), project=config.get("PROJECT_ID"), http_client=http_client, max_retries=0)
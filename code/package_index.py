@@ -0,0 +1,170 @@
+import os
+import re
+import struct
+
+from PIL import Image
+
+IMAGE_PATTERN = re.compile(r"^image_(\d+)\.png$")
+AUDIO_PATTERN = re.compile(r"^audio_(\d+)\.mp3$")
+
+# Bitrates in kbps, indexed by (is MPEG1, layer) then by the header's bitrate index.
+BITRATES = {
+    (True, 1): [0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448],
+    (True, 2): [0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384],
+    (True, 3): [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    (False, 1): [0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256],
+    (False, 2): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+    (False, 3): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+SAMPLE_RATES = {3: [44100, 48000, 32000], 2: [22050, 24000, 16000], 0: [11025, 12000, 8000]}
+
+
+def probe_mp3_duration(path):
+    """
+    Estimates an mp3's duration from its headers only: the Xing/Info or VBRI frame count when present,
+    otherwise the first frame's bitrate and the file size. Returns None if no valid frame header is found.
+    """
+    file_size = os.path.getsize(path)
+    with open(path, "rb") as audio_file:
+        id3_header = audio_file.read(10)
+        audio_start = 0
+        if id3_header[:3] == b"ID3" and len(id3_header) == 10:
+            tag_size = (id3_header[6] << 21) | (id3_header[7] << 14) | (id3_header[8] << 7) | id3_header[9]
+            audio_start = 10 + tag_size + (10 if id3_header[5] & 0x10 else 0)
+        audio_file.seek(audio_start)
+        head = audio_file.read(64 * 1024)
+        audio_file.seek(max(0, file_size - 128))
+        tail = audio_file.read(128)
+
+    audio_end = file_size - (128 if tail[:3] == b"TAG" else 0)
+
+    for offset in range(len(head) - 4):
+        if head[offset] != 0xFF or head[offset + 1] & 0xE0 != 0xE0:
+            continue
+        header = struct.unpack(">I", head[offset:offset + 4])[0]
+        version = (header >> 19) & 0b11
+        layer = 4 - ((header >> 17) & 0b11)
+        bitrate_index = (header >> 12) & 0b1111
+        sample_rate_index = (header >> 10) & 0b11
+        mono = (header >> 6) & 0b11 == 0b11
+        if version == 1 or layer == 4 or bitrate_index in (0, 15) or sample_rate_index == 3:
+            continue
+
+        mpeg1 = version == 3
+        bitrate = BITRATES[(mpeg1, layer)][bitrate_index] * 1000
+        sample_rate = SAMPLE_RATES[version][sample_rate_index]
+        samples_per_frame = 384 if layer == 1 else (1152 if mpeg1 or layer == 2 else 576)
+
+        side_info = (17 if mono else 32) if mpeg1 else (9 if mono else 17)
+        xing = offset + 4 + side_info
+        if head[xing:xing + 4] in (b"Xing", b"Info"):
+            flags = struct.unpack(">I", head[xing + 4:xing + 8])[0]
+            if flags & 1:
+                frames = struct.unpack(">I", head[xing + 8:xing + 12])[0]
+                return frames * samples_per_frame / sample_rate
+
+        vbri = offset + 4 + 32
+        if head[vbri:vbri + 4] == b"VBRI":
+            frames = struct.unpack(">I", head[vbri + 14:vbri + 18])[0]
+            return frames * samples_per_frame / sample_rate
+
+        return (audio_end - audio_start - offset) * 8 / bitrate
+
+    return None
+
+
+def probe_audio_duration(path):
+    duration = probe_mp3_duration(path)
+    if duration is None:
+        # Not a file we can read headers from, let ffmpeg decode it.
+        from moviepy.editor import AudioFileClip
+        audio = AudioFileClip(path)
+        duration = audio.duration
+        audio.close()
+    return duration
+
+
+class Package_Chunk():
+    def __init__(self, index, image_path, audio_path, duration, image_size):
+        self.index = index
+        self.image_path = image_path
+        self.audio_path = audio_path
+        self.duration = duration
+        self.image_size = image_size
+
+
+class Package_Index():
+    """
+    Lists a package's chunks (image_{i}.png + audio_{i}.mp3) once, with their audio durations from a header probe
+    and their image dimensions, so a package can be validated and scheduled before anything is decoded.
+    """
+
+    def __init__(self, package_path):
+        self.path = package_path
+        self.chunks = []
+        self.errors = []
+        self.build()
+
+    def build(self):
+        images = self.find_files("images", IMAGE_PATTERN)
+        audio = self.find_files("audio", AUDIO_PATTERN)
+
+        if not images:
+            self.errors.append("no images found")
+        if not audio:
+            self.errors.append("no audio found")
+
+        for index in sorted(set(images) | set(audio)):
+            if index not in images:
+                self.errors.append(f"chunk {index} has no image")
+            elif index not in audio:
+                self.errors.append(f"chunk {index} has no audio")
+        indices = sorted(set(images) & set(audio))
+        if indices != list(range(len(indices))):
+            self.errors.append(f"chunk indices are not contiguous: {indices}")
+        if self.errors:
+            return
+
+        for index in indices:
+            try:
+                with Image.open(images[index]) as image:
+                    image_size = image.size
+                duration = probe_audio_duration(audio[index])
+            except Exception as e:
+                self.errors.append(f"chunk {index} could not be probed: {e}")
+                continue
+            self.chunks.append(Package_Chunk(index, images[index], audio[index], duration, image_size))
+
+    def find_files(self, folder, pattern):
+        directory = os.path.join(self.path, folder)
+        if not os.path.isdir(directory):
+            return {}
+        files = {}
+        for file_name in os.listdir(directory):
+            match = pattern.match(file_name)
+            if match:
+                files[int(match.group(1))] = os.path.join(directory, file_name)
+        return files
+
+    def is_valid(self):
+        return not self.errors and len(self.chunks) > 0
+
+    def validate(self):
+        if not self.is_valid():
+            raise ValueError(f"Package {self.path} is not ready: {'; '.join(self.errors)}")
+
+    @property
+    def image_files(self):
+        return [chunk.image_path for chunk in self.chunks]
+
+    @property
+    def audio_files(self):
+        return [chunk.audio_path for chunk in self.chunks]
+
+    @property
+    def durations(self):
+        return [chunk.duration for chunk in self.chunks]
+
+    @property
+    def total_duration(self):
+        return sum(self.durations)
@@ -0,0 +1,93 @@
+import os
+import json
+import hashlib
+import tempfile
+import fcntl
+import threading
+from contextlib import contextmanager
+
+MANIFEST_FILE = "manifest.json"
+LOCK_FILE = "manifest.lock"
+
+
+def hash_content(*parts):
+    """ Stable sha256 of JSON serializable parts, used for package ids and stage inputs. """
+    source = json.dumps(parts, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(source.encode("utf-8")).hexdigest()
+
+
+def hash_file(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as artifact:
+        for block in iter(lambda: artifact.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def make_package_id(script_name, story):
+    """ Same script and substory content always map to the same package folder. """
+    return hash_content(script_name, story)[:16]
+
+
+class Package_Manifest():
+    """
+    Records, per stage (images, audio, video), the hash of the stage's inputs and of every artifact it wrote.
+    A stage is complete only if its inputs are unchanged and every artifact is still on disk with the same hash,
+    so an interrupted package is resumed by redoing only its missing or stale stages.
+    Artifact paths are relative to the package, so the manifest stays valid when the package folder is moved.
+    """
+
+    def __init__(self, package_path):
+        self.package_path = package_path
+        self.path = os.path.join(package_path, MANIFEST_FILE)
+        self.lock = threading.Lock()
+
+    def load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as manifest_file:
+                return json.load(manifest_file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {"stages": {}}
+
+    def save(self, manifest):
+        fd, tmp_path = tempfile.mkstemp(dir=self.package_path, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as tmp_file:
+            json.dump(manifest, tmp_file, indent=4)
+        os.replace(tmp_path, self.path)
+
+    def stage(self, name):
+        return self.load()["stages"].get(name)
+
+    def is_complete(self, name, input_hash):
+        record = self.stage(name)
+        if record is None or record["input_hash"] != input_hash:
+            return False
+
+        for relative_path, artifact_hash in record["artifacts"].items():
+            artifact_path = os.path.join(self.package_path, relative_path)
+            if not os.path.isfile(artifact_path) or hash_file(artifact_path) != artifact_hash:
+                return False
+        return True
+
+    @contextmanager
+    def locked(self):
+        """ Serializes manifest updates between threads, and between worker processes through a lock file. """
+        with self.lock:
+            with open(os.path.join(self.package_path, LOCK_FILE), "w") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def record(self, name, input_hash, relative_paths):
+        artifacts = {path: hash_file(os.path.join(self.package_path, path)) for path in relative_paths}
+        with self.locked():
+            manifest = self.load()
+            manifest["stages"][name] = {"input_hash": input_hash, "artifacts": artifacts}
+            self.save(manifest)
+
+    def artifact_hashes(self, *names):
+        """ Artifact hashes of the given stages, used as the input hash of a stage built on top of them. """
+        stages = self.load()["stages"]
+        return [stages.get(name, {}).get("artifacts") for name in names]
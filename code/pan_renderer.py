@@ -0,0 +1,101 @@
+import numpy as np
+from PIL import Image
+
+
+def linear(progress):
+    return progress
+
+def ease_in(progress):
+    return progress * progress
+
+def ease_out(progress):
+    return 1 - (1 - progress) ** 2
+
+def ease_in_out(progress):
+    return progress * progress * (3 - 2 * progress)
+
+EASINGS = {
+    "linear": linear,
+    "ease_in": ease_in,
+    "ease_out": ease_out,
+    "ease_in_out": ease_in_out,
+}
+
+
+class Pan_Renderer():
+    """
+    Ken Burns style pan and zoom over a still image.
+    The image is resized exactly once into a NumPy array. Without zoom every frame is a slice view of that array,
+    with zoom the visible window is resampled with precomputed nearest-neighbour indices.
+    Images narrower than the output are centered on black and held still, like ImageClip.on_color.
+    """
+
+    def __init__(self, image_path, width, height, duration, easing="linear", zoom_start=1.0, zoom_end=1.0):
+        self.width = width
+        self.height = height
+        self.duration = duration
+        self.easing = EASINGS[easing]
+        self.zoom_start = zoom_start
+        self.zoom_end = zoom_end
+        self.zooming = zoom_start != zoom_end or zoom_start != 1.0
+
+        image = Image.open(image_path).convert("RGB")
+        max_zoom = max(zoom_start, zoom_end)
+        scale = height * max_zoom / image.height
+        if self.zooming:
+            # A zooming window must stay covered by the image at every zoom level.
+            scale = max(scale, width * max_zoom / image.width)
+        size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+        self.source = np.asarray(image.resize(size, Image.Resampling.LANCZOS))
+        self.max_zoom = max_zoom
+
+        self.static_frame = None
+        if not self.zooming and self.source.shape[1] <= width:
+            frame = np.zeros((height, width, 3), dtype=np.uint8)
+            source = self.source[:height]
+            x = (width - source.shape[1]) // 2
+            y = (height - source.shape[0]) // 2
+            frame[y:y + source.shape[0], x:x + source.shape[1]] = source
+            self.static_frame = frame
+
+        self.output_rows = np.arange(height)
+        self.output_cols = np.arange(width)
+
+    @property
+    def is_static(self):
+        return self.static_frame is not None
+
+    def progress(self, t):
+        if self.duration <= 0:
+            return 0.0
+        return self.easing(min(max(t / self.duration, 0.0), 1.0))
+
+    def frame(self, t):
+        """ Returns the frame at time t as a (height, width, 3) uint8 array. """
+        if self.static_frame is not None:
+            return self.static_frame
+
+        progress = self.progress(t)
+        source_h, source_w = self.source.shape[:2]
+
+        if not self.zooming:
+            x = int((source_w - self.width) * progress)
+            return self.source[0:self.height, x:x + self.width]
+
+        zoom = self.zoom_start + (self.zoom_end - self.zoom_start) * progress
+        window_w = min(source_w, self.width * self.max_zoom / zoom)
+        window_h = min(source_h, self.height * self.max_zoom / zoom)
+        x = (source_w - window_w) * progress
+        y = (source_h - window_h) / 2
+
+        if window_w == self.width and window_h == self.height:
+            return self.source[int(y):int(y) + self.height, int(x):int(x) + self.width]
+
+        rows = (y + self.output_rows * (window_h / self.height)).astype(np.intp)
+        cols = (x + self.output_cols * (window_w / self.width)).astype(np.intp)
+        return self.source[rows[:, None], cols]
+
+    def iter_frames(self, fps):
+        """ Yields every frame of the segment at the given fps, ready to be handed to an encoder. """
+        for t in np.arange(0, self.duration, 1.0 / fps):
+            yield self.frame(t)
@@ -0,0 +1,47 @@
+import script_creation as sc
+import image_generator as ig
+import tts as tts
+import video_assembler as va
+from openai_client import make_client, make_http_client
+from rate_limiter import get_scheduler
+
+
+class Pipeline_Context():
+    """
+    Builds the OpenAI client, its pooled HTTP connections and the generators once per process,
+    so every package of a run reuses them instead of constructing its own.
+
+    Usage:
+        with Pipeline_Context(image_concurrency=4, tts_workers=4) as context:
+            generate_images_for_stories(package_dir, story, image_generator=context.image_generator)
+    """
+
+    def __init__(self, client=None, image_concurrency=4, tts_workers=4, scheduler=None, script_format="json"):
+        self.owns_client = client is None
+        if client is None:
+            client = make_client(make_http_client())
+        self.client = client
+        self.scheduler = scheduler or get_scheduler()
+        self.script_generator = sc.Script_Generator(client=client, scheduler=self.scheduler, output_format=script_format)
+        self.image_generator = ig.Image_Generator(client=client, max_in_flight=image_concurrency,
+                                                  scheduler=self.scheduler, script_generator=self.script_generator)
+        self.speech_generator = tts.Speech_Generator(client=client, max_workers=tts_workers,
+                                                     scheduler=self.scheduler, script_generator=self.script_generator)
+        self.video_editors = {}
+
+    def video_editor(self, backend="moviepy"):
+        if backend not in self.video_editors:
+            self.video_editors[backend] = va.Video_Editor(backend=backend)
+        return self.video_editors[backend]
+
+    def close(self):
+        # Only close connections this context opened, an injected client belongs to the caller.
+        if self.owns_client and hasattr(self.client, "close"):
+            self.client.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
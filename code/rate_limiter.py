@@ -0,0 +1,170 @@
+import os
+import time
+import random
+import threading
+
+import openai
+
+from tracing import tracer
+
+RATE_LIMIT = "rate_limit"
+TRANSIENT = "transient"
+CONTENT_POLICY = "content_policy"
+FATAL = "fatal"
+
+# Requests per minute per endpoint, overridable with OPENAI_RPM_CHAT, OPENAI_RPM_IMAGES and OPENAI_RPM_SPEECH.
+DEFAULT_RATE_LIMITS = {"chat": 500, "images": 50, "speech": 500}
+
+
+def error_code(error):
+    body = getattr(error, "body", None)
+    if isinstance(body, dict):
+        body = body.get("error", body)
+        if isinstance(body, dict):
+            return body.get("code")
+    return getattr(error, "code", None)
+
+
+def classify_error(error):
+    """
+    Sorts an API error into RATE_LIMIT (wait and retry), TRANSIENT (retry), CONTENT_POLICY (rewrite the prompt)
+    or FATAL (give up, e.g. a bad key or an exhausted quota).
+    """
+    if isinstance(error, openai.RateLimitError):
+        return FATAL if error_code(error) == "insufficient_quota" else RATE_LIMIT
+    if isinstance(error, (openai.APIConnectionError, openai.InternalServerError)):
+        return TRANSIENT
+    if isinstance(error, openai.APIStatusError):
+        if error_code(error) == "content_policy_violation" or "safety system" in str(error):
+            return CONTENT_POLICY
+        if error.status_code in (408, 409) or error.status_code >= 500:
+            return TRANSIENT
+    return FATAL
+
+
+def retry_after(error):
+    """ Seconds the API asked us to wait, from the retry-after(-ms) headers, or None. """
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    try:
+        if "retry-after-ms" in response.headers:
+            return float(response.headers["retry-after-ms"]) / 1000
+        if "retry-after" in response.headers:
+            return float(response.headers["retry-after"])
+    except ValueError:
+        pass
+    return None
+
+
+class Token_Bucket():
+    """
+    Allows `rate_per_minute` requests with bursts of up to `burst` requests.
+    The rate adapts: it is halved on every rate limit error and recovers gradually with each success,
+    and a rate limit pauses the whole bucket so the other threads do not keep hitting the limit.
+    """
+
+    def __init__(self, rate_per_minute, burst=None):
+        self.max_rate = rate_per_minute / 60
+        self.rate = self.max_rate
+        self.capacity = burst or max(1.0, self.max_rate * 10)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self):
+        """ Blocks until a request may be sent. Returns the seconds spent waiting. """
+        waited = 0.0
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.refill(now)
+                if now < self.paused_until:
+                    delay = self.paused_until - now
+                elif self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                else:
+                    delay = (1 - self.tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+    def on_success(self):
+        with self.lock:
+            self.rate = min(self.max_rate, self.rate + self.max_rate * 0.05)
+
+    def on_rate_limit(self, pause):
+        with self.lock:
+            now = time.monotonic()
+            self.refill(now)
+            self.rate = max(self.max_rate * 0.05, self.rate / 2)
+            self.tokens = 0
+            self.paused_until = max(self.paused_until, now + pause)
+
+
+class Request_Scheduler():
+    """
+    Sends every OpenAI request of the process through one token bucket per endpoint,
+    and retries rate limited and transient failures with jittered exponential backoff.
+    Content policy and fatal errors are raised straight away, the caller decides whether to rewrite the prompt.
+    """
+
+    def __init__(self, rate_limits=None, max_retries=5, base_delay=1.0, max_delay=60.0):
+        rate_limits = dict(DEFAULT_RATE_LIMITS, **(rate_limits or {}))
+        for endpoint in rate_limits:
+            if os.environ.get(f"OPENAI_RPM_{endpoint.upper()}"):
+                rate_limits[endpoint] = float(os.environ[f"OPENAI_RPM_{endpoint.upper()}"])
+        self.buckets = {endpoint: Token_Bucket(limit) for endpoint, limit in rate_limits.items()}
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def backoff(self, attempt):
+        # Equal jitter: at least half the exponential delay, so concurrent retries spread out without stalling.
+        delay = min(self.max_delay, self.base_delay * 2 ** attempt)
+        return delay * random.uniform(0.5, 1.0)
+
+    def call(self, endpoint, function, *args, **kwargs):
+        bucket = self.buckets[endpoint]
+        for attempt in range(self.max_retries + 1):
+            tracer.add("wait_seconds", bucket.acquire())
+            start = time.perf_counter()
+            try:
+                result = function(*args, **kwargs)
+            except Exception as e:
+                tracer.add("api_seconds", time.perf_counter() - start)
+                kind = classify_error(e)
+                if kind in (CONTENT_POLICY, FATAL) or attempt == self.max_retries:
+                    raise
+
+                delay = self.backoff(attempt)
+                if kind == RATE_LIMIT:
+                    delay = max(delay, retry_after(e) or 0)
+                    bucket.on_rate_limit(delay)
+                print(f"{endpoint} request failed ({kind}), retrying in {delay:.1f}s: {e}")
+                tracer.add("retries")
+                tracer.add("wait_seconds", delay)
+                time.sleep(delay)
+                continue
+
+            tracer.add("api_seconds", time.perf_counter() - start)
+            bucket.on_success()
+            return result
+
+
+scheduler = None
+scheduler_lock = threading.Lock()
+
+
+def get_scheduler():
+    """ The process-wide scheduler shared by every generator. """
+    global scheduler
+    with scheduler_lock:
+        if scheduler is None:
+            scheduler = Request_Scheduler()
+        return scheduler
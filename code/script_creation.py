@@ -1,9 +1,232 @@
-from openai import OpenAI
-from dotenv import dotenv_values
+from openai_client import make_client, cache_dir
 import re
-import tiktoken
+import textwrap
+from information_extraction import get_encoding
+from text_chunker import Text_Chunker, Script_Part, CHUNK_TOKENS
 import json
 import os
+import threading
+from concurrent.futures import Future
+from cache import Disk_Cache
+from tracing import tracer, chat_cost
+from rate_limiter import get_scheduler
+
+# Limits SUBSTORY_REQUIREMENTS and the text prompt put on a substory, its output budget is sized from them.
+MAX_CHUNKS = 8
+MAX_LINE_WORDS = 30
+MAX_PROMPT_WORDS = 35
+MAX_TITLE_AND_GENERAL_PROMPT_WORDS = 60
+# English prose runs about 1.3 gpt-4o tokens per word, rounded up so long words still fit.
+TOKENS_PER_WORD = 1.5
+# Quotes, commas and key names around each string of a JSON substory, or the labels of the text format.
+TOKENS_PER_ITEM = 6
+
+# Output tokens of a substory at every limit, plus room for the JSON around the substories.
+# Requests are capped by the model's completion limit.
+SUBSTORY_OUTPUT_TOKENS = round(TOKENS_PER_WORD * (MAX_CHUNKS * (MAX_LINE_WORDS + MAX_PROMPT_WORDS) + MAX_TITLE_AND_GENERAL_PROMPT_WORDS)
+                               + TOKENS_PER_ITEM * (2 * MAX_CHUNKS + 2))
+SCRIPT_OUTPUT_OVERHEAD = 200
+MAX_OUTPUT_TOKENS = 16384
+
+SUBSTORY_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "title": {"type": "string"},
+        "lines": {"type": "array", "items": {"type": "string"}},
+        "prompts": {"type": "array", "items": {"type": "string"}},
+        "general_prompt": {"type": "string"},
+    },
+    "required": ["title", "lines", "prompts", "general_prompt"],
+    "additionalProperties": False,
+}
+
+# Substories of a request packing several chapters also give the number of the chapter they come from.
+PACKED_SUBSTORY_SCHEMA = {
+    **SUBSTORY_SCHEMA,
+    "properties": {"chapter": {"type": "integer"}, **SUBSTORY_SCHEMA["properties"]},
+    "required": ["chapter"] + SUBSTORY_SCHEMA["required"],
+}
+
+
+def script_response_format(name, substory_schema):
+    schema = {
+        "type": "object",
+        "properties": {"substories": {"type": "array", "items": substory_schema}},
+        "required": ["substories"],
+        "additionalProperties": False,
+    }
+    return {"type": "json_schema", "json_schema": {"name": name, "strict": True, "schema": schema}}
+
+
+SCRIPT_RESPONSE_FORMAT = script_response_format("shorts_script", SUBSTORY_SCHEMA)
+PACKED_SCRIPT_RESPONSE_FORMAT = script_response_format("shorts_scripts_by_chapter", PACKED_SUBSTORY_SCHEMA)
+
+SUBSTORY_REQUIREMENTS = """For each substory return:
+- title: the title of the substory.
+- lines: 5 to 8 chunks of narration, 5 to 10 seconds each (at most 30 words), one cohesive idea or scene per chunk.
+- prompts: one image generation prompt per chunk, in the same order, describing its background image in at most 35 words.
+- general_prompt: one sentence applied to every image of the substory so the images stay consistent."""
+
+STRUCTURED_SYSTEM_MESSAGE = f"""You are a professional scriptwriter specializing in short-form content creation.
+
+Your task is to:
+1. Receive a chapter from a book.
+2. Identify a given number, x, of substories from the chapter.
+3. Write a short script for each substory, read aloud by a single narrator in 60 seconds.
+
+{SUBSTORY_REQUIREMENTS}
+
+Return exactly x substories and nothing but the JSON."""
+
+PACKED_SYSTEM_MESSAGE = f"""You are a professional scriptwriter specializing in short-form content creation.
+
+Your task is to:
+1. Receive several chapters from a book, each starting with a line "=== CHAPTER n START: title ===" and ending with "=== CHAPTER n END ===".
+2. Identify a given number, x, of substories in every chapter.
+3. Write a short script for each substory, read aloud by a single narrator in 60 seconds.
+
+{SUBSTORY_REQUIREMENTS}
+- chapter: the number n of the chapter the substory is taken from. A substory never spans two chapters.
+
+Return exactly x substories for every chapter and nothing but the JSON."""
+
+
+def script_output_budget(num_scripts):
+    """ max_tokens for a request of `num_scripts` substories, so three scripts are no longer cut off at 2000 tokens. """
+    return min(MAX_OUTPUT_TOKENS, SCRIPT_OUTPUT_OVERHEAD + num_scripts * SUBSTORY_OUTPUT_TOKENS)
+
+
+def fallback_output_budget(max_tokens):
+    """
+    max_tokens for the text request sent after unusable structured output. That output was most likely cut off
+    past the substory limits, the same budget would cut the wordier text format off again.
+    """
+    return min(MAX_OUTPUT_TOKENS, 2 * max_tokens)
+
+
+def parse_substories(lines):
+    """
+    Parses script text line by line and yields each substory as soon as the next one starts (or the text ends).
+    Keeps no state outside the call, so any number of scripts can be parsed at once without reading them whole.
+    """
+    current_substory = {}
+    mode = None  # Keeps track of the active section (e.g., lines, prompts)
+
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue  # Skip empty lines
+
+        # Check for the start of a new substory
+        if line.startswith("**Substory Title**") or line.startswith("**Substory"):
+            # The previous substory is complete, hand it out before reading on
+            if current_substory:
+                yield current_substory
+            current_substory = {"title": line.split(":", 1)[1].strip() if ":" in line else ""}
+            mode = None  # Reset mode for the new substory
+
+        # Check for section markers
+        elif "**Script**" in line:
+            current_substory["lines"] = []
+            mode = "lines"
+        elif "**Image Prompts**" in line:
+            current_substory["prompts"] = []
+            mode = "prompts"
+        elif line.startswith("**General Script Prompt**") or line.startswith("**General Image Prompt**"):
+            current_substory["general_prompt"] = line.split(":", 1)[1].strip()
+            mode = None  # General prompts don't have chunks
+
+        # Process chunks based on the active mode
+        elif ("Chunk" in line or line.startswith("- **Chunk")) and ":" in line:
+            chunk_content = line.split(":", 1)[1].strip()
+            if mode == "lines":
+                current_substory.setdefault("lines", []).append(chunk_content)
+            elif mode == "prompts":
+                current_substory.setdefault("prompts", []).append(chunk_content)
+
+    # Yield the last substory
+    if current_substory:
+        yield current_substory
+
+
+def validate_substory(substory, idx=0):
+    """ Validates the structure and completeness of one substory. """
+    if not isinstance(substory, dict):
+        print(f"Substory {idx} is not a dictionary.")
+        return False
+
+    # Ensure title exists and is a non-empty string
+    if "title" not in substory or not isinstance(substory["title"], str) or not substory["title"].strip():
+        print(f"Substory {idx} missing a valid title.")
+        return False
+
+    # Ensure at least 5 chunks in 'lines'
+    if "lines" not in substory or not isinstance(substory["lines"], list) or len(substory["lines"]) < 5:
+        print(f"Substory {idx} does not contain enough lines (chunks).")
+        return False
+
+    # Ensure at least 5 prompts in 'prompts'
+    if "prompts" not in substory or not isinstance(substory["prompts"], list) or len(substory["prompts"]) < 5:
+        print(f"Substory {idx} does not contain enough image prompts.")
+        return False
+
+    # Every narration chunk needs its image, and both are sent to the APIs as text
+    if len(substory["lines"]) != len(substory["prompts"]):
+        print(f"Substory {idx} has {len(substory['lines'])} lines but {len(substory['prompts'])} image prompts.")
+        return False
+    if not all(isinstance(item, str) and item.strip() for item in substory["lines"] + substory["prompts"]):
+        print(f"Substory {idx} has empty or non-text lines or prompts.")
+        return False
+
+    # Ensure a general prompt is present
+    if "general_prompt" not in substory or not isinstance(substory["general_prompt"], str) or not substory["general_prompt"].strip():
+        print(f"Substory {idx} missing a general prompt.")
+        return False
+
+    return True
+
+
+def load_substories(content):
+    """ The substories of a structured response, raises ValueError if the JSON is missing, cut off or malformed. """
+    try:
+        substories = json.loads(content)["substories"]
+    except (TypeError, KeyError, json.JSONDecodeError) as e:
+        raise ValueError(f"unusable structured output: {e!r}") from e
+    if not isinstance(substories, list):
+        raise ValueError("unusable structured output: substories is not a list")
+    return substories
+
+
+def stream_script(path):
+    """ Yields the valid substories of the script at `path` while the file is being read, invalid ones are dropped. """
+    with open(path, "r", encoding="utf-8") as script_file:
+        for idx, substory in enumerate(parse_substories(script_file)):
+            if validate_substory(substory, idx):
+                yield substory
+            else:
+                print(f"Discarding substory {idx} of {path}.")
+
+
+def write_substories(substories, path):
+    """
+    Passes substories through while writing them to `path` as {"substories": [...]}, one at a time.
+    The file is only moved into place once the last substory is written, and not at all if there was none.
+    """
+    tmp_path = f"{path}.tmp"
+    count = 0
+    with open(tmp_path, "w", encoding="utf-8") as json_file:
+        json_file.write('{\n    "substories": [')
+        for substory in substories:
+            item = textwrap.indent(json.dumps(substory, indent=4), " " * 8)
+            json_file.write(("," if count else "") + "\n" + item)
+            count += 1
+            yield substory
+        json_file.write("\n    ]\n}" if count else "]\n}")
+
+    if count:
+        os.replace(tmp_path, path)
+    else:
+        os.remove(tmp_path)
 
 
 class Script_Processor:
@@ -13,9 +236,9 @@ class Script_Processor:
     
     def process_script(self, path, write_to_file=True):
         "If write to file is set to true it'll write to file and return json"
-        self.text_to_dict(path)
+        self.processed_script = {"substories": list(stream_script(path))}
 
-        if not self.validate_script(self.processed_script):
+        if not self.processed_script["substories"]:
             print("Script validation failed. Discarding.")
             return None  # Don't process invalid scripts
         
@@ -32,49 +255,8 @@ class Script_Processor:
             return file.readlines()
 
     def text_to_dict(self, path):
-        self.unprossed_script = self.extract_script(path)
-        all_substories = []
-        current_substory = {}
-        mode = None  # Keeps track of the active section (e.g., lines, prompts)
-    
-        for line in self.unprossed_script:
-            line = line.strip()
-            if not line:
-                continue  # Skip empty lines
-    
-            # Check for the start of a new substory
-            if line.startswith("**Substory Title**") or line.startswith("**Substory"):
-                # If there's an existing substory, save it to the list
-                if current_substory:
-                    all_substories.append(current_substory)
-                # Start a new substory
-                current_substory = {"title": line.split(":", 1)[1].strip()}
-                mode = None  # Reset mode for the new substory
-    
-            # Check for section markers
-            elif "**Script**" in line:
-                current_substory["lines"] = []
-                mode = "lines"
-            elif "**Image Prompts**" in line:
-                current_substory["prompts"] = []
-                mode = "prompts"
-            elif line.startswith("**General Script Prompt**") or line.startswith("**General Image Prompt**"):
-                current_substory["general_prompt"] = line.split(":", 1)[1].strip()
-                mode = None  # General prompts don't have chunks
-    
-            # Process chunks based on the active mode
-            elif "Chunk" in line or line.startswith("- **Chunk"):
-                chunk_content = line.split(":", 1)[1].strip()
-                if mode == "lines":
-                    current_substory.setdefault("lines", []).append(chunk_content)
-                elif mode == "prompts":
-                    current_substory.setdefault("prompts", []).append(chunk_content)
-    
-        # Append the last substory
-        if current_substory:
-            all_substories.append(current_substory)
-    
-        self.processed_script = {"substories": all_substories}
+        with open(path, "r", encoding="utf-8") as script_file:
+            self.processed_script = {"substories": list(parse_substories(script_file))}
         return self.processed_script
 
 
@@ -99,7 +281,7 @@ class Script_Processor:
 
 
     def validate_script(self, script_json):
-        """ Validates the structure and completeness of the JSON script object. """
+        """ Validates the structure and completeness of the JSON script object, checking every substory. """
         if not isinstance(script_json, dict):
             print("Invalid format: Expected a dictionary.")
             return False
@@ -110,64 +292,151 @@ class Script_Processor:
             return False
         
         for idx, substory in enumerate(script_json["substories"]):
-            if not isinstance(substory, dict):
-                print(f"Substory {idx} is not a dictionary.")
-                return False
-            
-            # Ensure title exists and is a non-empty string
-            if "title" not in substory or not isinstance(substory["title"], str) or not substory["title"].strip():
-                print(f"Substory {idx} missing a valid title.")
-                return False
-    
-            # Ensure at least 5 chunks in 'lines'
-            if "lines" not in substory or not isinstance(substory["lines"], list) or len(substory["lines"]) < 5:
-                print(f"Substory {idx} does not contain enough lines (chunks).")
-                return False
-    
-            # Ensure at least 5 prompts in 'prompts'
-            if "prompts" not in substory or not isinstance(substory["prompts"], list) or len(substory["prompts"]) < 5:
-                print(f"Substory {idx} does not contain enough image prompts.")
-                return False
-            
-            # Ensure a general prompt is present
-            if "general_prompt" not in substory or not isinstance(substory["general_prompt"], str) or not substory["general_prompt"].strip():
-                print(f"Substory {idx} missing a general prompt.")
+            if not validate_substory(substory, idx):
                 return False
 
-            print("Script JSON is valid.")
-            return True  # If all checks pass
+        print("Script JSON is valid.")
+        return True  # If all checks pass
 
 class Script_Generator:
-    def __init__(self):
+    # Requests currently being sent by any generator in this process, keyed like the cache.
+    in_flight_requests = {}
+    in_flight_lock = threading.Lock()
+
+    def __init__(self, client=None, cache=None, scheduler=None, output_format="json"):
         self.data = []
-        config = dotenv_values(".env")
-        self.client =  OpenAI(api_key=config.get("API_KEY"),project=config.get("PROJECT_ID"))
+        # "json" asks for SCRIPT_RESPONSE_FORMAT structured output, "text" for the markdown format Script_Processor parses.
+        self.output_format = output_format
+        if client is None:
+            client = make_client()
+        self.client = client
+        self.scheduler = scheduler or get_scheduler()
+        if cache is None:
+            cache = Disk_Cache(cache_dir("chat"), suffix=".txt", max_bytes=256 * 1024**2, max_age=30 * 24 * 3600)
+        self.cache = cache
+
+    def chat(self, system_message, user_prompt, model="gpt-4o", max_tokens=2000, response_format=None):
+        """
+        Sends a chat completion, memoized on disk by model, system message, user prompt, max_tokens and response_format.
+        Identical requests sent at the same time are merged into a single API call.
+        Rate limits and transient errors are retried by the shared request scheduler.
+        Completions cut off by max_tokens are returned but not cached.
+        """
+        # Plain text requests keep the cache keys they had before response_format existed.
+        key_parts = (model, system_message, user_prompt, max_tokens) + ((response_format,) if response_format else ())
+        cache_key = Disk_Cache.make_key(*key_parts)
+        cached = self.cache.get(cache_key)
+        if cached is not None:
+            tracer.add("cache_hits")
+            return cached.read_text(encoding="utf-8")
+
+        with Script_Generator.in_flight_lock:
+            future = Script_Generator.in_flight_requests.get(cache_key)
+            if future is not None:
+                owner = False
+            else:
+                # The request may have completed between the cache check and taking the lock.
+                cached = self.cache.get(cache_key)
+                if cached is not None:
+                    return cached.read_text(encoding="utf-8")
+                owner = True
+                future = Future()
+                Script_Generator.in_flight_requests[cache_key] = future
+
+        if not owner:
+            return future.result()
+
+        try:
+            request = {
+                "model": model,
+                "messages": [
+                    {"role": "system", "content": system_message},
+                    {"role": "user", "content": user_prompt}
+                ],
+                "max_tokens": max_tokens,
+            }
+            if response_format is not None:
+                request["response_format"] = response_format
+            response = self.scheduler.call("chat", self.client.chat.completions.create, **request)
+            usage = getattr(response, "usage", None)
+            if usage is not None:
+                tracer.add("tokens_in", usage.prompt_tokens)
+                tracer.add("tokens_out", usage.completion_tokens)
+                tracer.add("cost_usd", chat_cost(model, usage.prompt_tokens, usage.completion_tokens))
+            choice = response.choices[0]
+            content = choice.message.content
+            if choice.finish_reason == "length":
+                print(f"Chat completion truncated at max_tokens={max_tokens}.")
+                tracer.set("truncated", True)
+            elif content is not None:
+                self.cache.put_bytes(cache_key, content.encode("utf-8"))
+            future.set_result(content)
+            return content
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with Script_Generator.in_flight_lock:
+                Script_Generator.in_flight_requests.pop(cache_key, None)
 
     def create_script(self, data, ignore_processed_data=True):
         self.data = data
         scripts = []
 
-        cleaned_title = self.clean_title_name(self.data.title)
-       
-        # check if script file already exists
-        if ignore_processed_data:
-            #TODO reomve the {0} part and do a contain search 
-            try:
-                with open(f"data_output/scripts/{cleaned_title}_{0}.txt", "r") as _:
-                    print("Script already exists for this data.")
-                    return
-            except FileNotFoundError:
-                pass
-        
-        parts = self.token_format(self.data)
+        plan = self.plan_script(self.data, ignore_processed_data)
+        if plan is None:
+            return
+        cleaned_title, parts = plan
+
         for part in parts:
             scripts.append(self.generate_script(chapter=part, title=self.data.title, num_scripts=3))
         
         for i, script in enumerate(scripts):
             self.write_script(script, f"{cleaned_title}_{i}") 
 
+    def plan_script(self, data, ignore_processed_data=True):
+        """
+        Returns (cleaned_title, parts) for a chapter, where parts are the text chunks to send to GPT,
+        or None if a script already exists for this chapter.
+        """
+        cleaned_title = self.clean_title_name(data.title)
+       
+        # check if script file already exists
+        if ignore_processed_data and self.script_exists(cleaned_title):
+            print("Script already exists for this data.")
+            return None
+
+        return cleaned_title, self.token_format(data)
+
+    def plan_parts(self, chapters, ignore_processed_data=True):
+        """
+        Yields a Script_Part for every chunk of every chapter without a script yet, chunk i of a chapter
+        being written to {cleaned_title}_{i}. Feed them to text_chunker.pack_parts to batch short chapters.
+        """
+        for chapter in chapters:
+            cleaned_title = self.clean_title_name(chapter.title)
+            if ignore_processed_data and self.script_exists(cleaned_title):
+                print(f"Script already exists for {chapter.title}.")
+                continue
+            chunks = self.chunk_chapter(chapter)
+            for i, (text, token_count) in enumerate(chunks):
+                yield Script_Part(f"{cleaned_title}_{i}", chapter.title, text, token_count, whole_chapter=len(chunks) == 1)
+
+    def script_exists(self, cleaned_title):
+        # Structured scripts are written straight to processed_scripts.
+        #TODO reomve the {0} part and do a contain search 
+        return (os.path.exists(f"data_output/scripts/{cleaned_title}_{0}.txt")
+                or os.path.exists(f"data_output/processed_scripts/{cleaned_title}_{0}.json"))
+
     def write_script(self, script, title):
-        if script != None:
+        if isinstance(script, dict):
+            # Structured scripts are already validated substories, they skip the text parsing stage.
+            print("Writing processed script to file...")
+            path = f"data_output/processed_scripts/{title}.json"
+            with open(f"{path}.tmp", "w", encoding="utf-8") as my_file:
+                json.dump(script, my_file, indent=4)
+            os.replace(f"{path}.tmp", path)
+        elif script != None:
             print("Writing script to file...")
             with open(f"data_output/scripts/{title}.txt", "w") as my_file:
                 my_file.write(script)
@@ -176,31 +445,19 @@ class Script_Generator:
 
     
     def token_format(self, data):
-        MAX_TOKENS = 8000  
-        MIN_LAST_CHUNK = 2000
-    
-        encoding = tiktoken.encoding_for_model(data.model)  
-        tokens = encoding.encode(data.text) 
-    
-        if len(tokens) > MAX_TOKENS:
-            num_chunks = len(tokens) // MAX_TOKENS
-            avg_chunk_size = len(tokens) // (num_chunks + 1)
-    
-            if len(tokens) % MAX_TOKENS < MIN_LAST_CHUNK:
-                avg_chunk_size = len(tokens) // num_chunks
-    
-            avg_chunk_size = int(avg_chunk_size)
-    
-            token_chunks = [
-                tokens[i:i+avg_chunk_size] 
-                for i in range(0, len(tokens), avg_chunk_size)
-            ]
-    
-            text_chunks = [encoding.decode(chunk) for chunk in token_chunks]
-    
-            return text_chunks
-        else:
-            return [data.text]
+        return [text for text, _ in self.chunk_chapter(data)]
+
+    def chunk_chapter(self, data):
+        """
+        Splits the chapter into request sized (text, token_count) chunks at paragraph and scene boundaries.
+        Reuses the tokens computed during extraction instead of encoding the chapter again.
+        How full the requests are is only known once chunks and short chapters are packed (see utilization_report).
+        """
+        chunker = Text_Chunker(get_encoding(data.model), max_tokens=CHUNK_TOKENS)
+        with tracer.span("chunk_chapter", title=data.title) as span:
+            chunks = chunker.chunk(data.text, data.get_tokens())
+            span.set("chunks", len(chunks))
+        return chunks
 
 
     def clean_title_name(self, title):
@@ -218,15 +475,7 @@ class Script_Generator:
                         {prompt}
                         """ 
         try:
-            response = self.client.chat.completions.create(
-                model="gpt-4o",
-                messages=[
-                    {"role": "system", "content": system_message},
-                    {"role": "user", "content": built_prompt}
-                ],
-                max_tokens=2000  
-                )
-            regened_prompt = response.choices[0].message.content
+            regened_prompt = self.chat(system_message, built_prompt, max_tokens=2000)
             return regened_prompt
         except Exception as e:
             print(f"Error generating script: {e}")
@@ -242,34 +491,98 @@ class Script_Generator:
                         {prompt}
                         """ 
         try:
-            response = self.client.chat.completions.create(
-                model="gpt-4o",
-                messages=[
-                    {"role": "system", "content": system_message},
-                    {"role": "user", "content": built_prompt}
-                ],
-                max_tokens=2000  
-                )
-            regened_prompt = response.choices[0].message.content
+            regened_prompt = self.chat(system_message, built_prompt, max_tokens=2000)
             return regened_prompt
         except Exception as e:
             print(f"Error generating script: {e}")
             return 
 
 
-    def generate_script(self, chapter="", title="", num_scripts=1, prompt="Generate a script the script for the following chapter.", system_message=None):
+    def generate_structured_script(self, built_prompt, max_tokens):
+        """
+        Requests the substories as SCRIPT_RESPONSE_FORMAT JSON and returns {"substories": [...]} with the valid ones,
+        or None if its output is unusable (e.g. cut off or refused), so the caller can fall back to text.
+        """
+        # API errors were already retried by the scheduler and propagate, a text request would hit the same endpoint.
+        content = self.chat(STRUCTURED_SYSTEM_MESSAGE, built_prompt, max_tokens=max_tokens, response_format=SCRIPT_RESPONSE_FORMAT)
+        try:
+            substories = load_substories(content)
+        except ValueError as e:
+            print(f"Structured script generation failed, falling back to the text format: {e}")
+            return None
+
+        valid = [substory for idx, substory in enumerate(substories) if validate_substory(substory, idx)]
+        if not valid:
+            print("Structured script has no valid substories, falling back to the text format.")
+            return None
+        return {"substories": valid}
+
+    def generate_scripts_for_parts(self, parts, num_scripts=3):
+        """
+        Returns one script per Script_Part, as generate_script does. Several parts go out as one packed request,
+        and any part the packed response left without a valid substory is requested again on its own.
+        An API error of the packed request fails all its parts, they would hit the same endpoint again.
+        """
+        if len(parts) > 1 and self.output_format == "json":
+            try:
+                scripts = self.generate_packed_script(parts, num_scripts) or [None] * len(parts)
+            except Exception as e:
+                print(f"Error generating scripts: {e}")
+                return [None] * len(parts)
+        else:
+            scripts = [None] * len(parts)
+        return [script or self.generate_script(chapter=part.text, title=part.chapter_title, num_scripts=num_scripts)
+                for part, script in zip(parts, scripts)]
+
+    def generate_packed_script(self, parts, num_scripts=3, prompt="Generate the scripts for the following chapters."):
+        """
+        Sends several chapters in one structured request, between "=== CHAPTER n START/END ===" markers, and
+        splits the substories back out by their chapter number. Returns one {"substories": [...]} (or None when
+        a chapter got no valid substory) per part, or None if the output is unusable. API errors propagate.
+        """
+        print(f'Generating scripts for {len(parts)} chapters...')
+        chapters = "\n".join(f"=== CHAPTER {n} START: {part.chapter_title} ===\n{part.text}\n=== CHAPTER {n} END ==="
+                             for n, part in enumerate(parts, start=1))
+        built_prompt = f"""
+                        Give me {num_scripts} amount of scripts for each chapter.
+                        {prompt}
+                        {chapters}
+                        """
+        with tracer.span("generate_script", title=", ".join(part.chapter_title for part in parts), chapters=len(parts)) as span:
+            span.set("format", "packed")
+            content = self.chat(PACKED_SYSTEM_MESSAGE, built_prompt, max_tokens=script_output_budget(num_scripts * len(parts)),
+                                response_format=PACKED_SCRIPT_RESPONSE_FORMAT)
+            try:
+                substories = load_substories(content)
+            except ValueError as e:
+                print(f"Packed script generation failed, requesting the chapters one by one: {e}")
+                span.set("fallback", True)
+                return None
+
+            by_part = [[] for _ in parts]
+            for idx, substory in enumerate(substories):
+                chapter = substory.pop("chapter", None) if isinstance(substory, dict) else None
+                if not isinstance(chapter, int) or not 1 <= chapter <= len(parts):
+                    print(f"Substory {idx} names no chapter of the request. Discarding.")
+                    continue
+                if validate_substory(substory, idx):
+                    by_part[chapter - 1].append(substory)
+            return [{"substories": substories} if substories else None for substories in by_part]
+
+    def generate_script(self, chapter="", title="", num_scripts=1, prompt="Generate a script the script for the following chapter.", system_message=None, output_format=None):
         """
         Generate scripts for a chapter using GPT.
         
         Args:
             chapter (Chapter): The chapter object.
             num_scripts (int): Number of scripts to generate.
-            style (str): Desired script style (e.g., 'dialogue', 'narrative', etc.).
+            output_format (str): "json" or "text", defaults to self.output_format. Ignored with a custom system_message.
         
         Returns:
-            List of generated scripts.
+            {"substories": [...]} for structured output, the script text for the text format, or None on error.
         """
         print('Generating script...')
+        structured = (output_format or self.output_format) == "json" and system_message is None
 
         if system_message == None:
             system_message = """You are a professional scriptwriter specializing in short-form content creation. 
@@ -282,7 +595,8 @@ class Script_Generator:
                                 Requirements for each script:
                                 - Each script should narrate a story in a clear and engaging style suitable for a single narrator.
                                 - The narration should be concise, designed to be read aloud in 60 seconds.
-                                - Give a minimum of 5 chunks of narration for each script.
+                                - Give a minimum of 5 chunks of narration for each script, each at most 30 words.
+                                - Keep every image prompt under 35 words so all the scripts fit in the response.
                                 - Divide the script into chunks of 5 to 10 seconds each. Each chunk should contain a single cohesive idea or scene that aligns with the story.
                                 - For each chunk, provide a detailed and imaginative prompt for an image generation model to create a relevant background image.
                                 - Add a general prompt to be applied the entire script to ensure consistency in the image generation.
@@ -328,18 +642,26 @@ class Script_Generator:
                         Chapter:
                         {chapter}
                         """ 
-        try:
-            response = self.client.chat.completions.create(
-                model="gpt-4o",
-                messages=[
-                    {"role": "system", "content": system_message},
-                    {"role": "user", "content": built_prompt}
-                ],
-                max_tokens=2000  # Adjust based on GPT's token limits
-            )
-            scripts = response.choices[0].message.content
-            return scripts
-        except Exception as e:
-            print(f"Error generating script: {e}")
-            return 
+        max_tokens = script_output_budget(num_scripts)
+        with tracer.span("generate_script", title=title) as span:
+            if structured:
+                try:
+                    script = self.generate_structured_script(built_prompt, max_tokens)
+                except Exception as e:
+                    print(f"Error generating script: {e}")
+                    span.set("error", repr(e))
+                    return
+                if script is not None:
+                    span.set("format", "json")
+                    return script
+                span.set("fallback", True)
+                max_tokens = fallback_output_budget(max_tokens)
+            span.set("format", "text")
+            try:
+                scripts = self.chat(system_message, built_prompt, max_tokens=max_tokens)
+                return scripts
+            except Exception as e:
+                print(f"Error generating script: {e}")
+                span.set("error", repr(e))
+                return 
 
@@ -0,0 +1,64 @@
+import os
+import json
+import tempfile
+
+from package_manifest import hash_file
+
+
+class Script_Index():
+    """
+    Remembers, for every processed script, its mtime, size and content hash and the package ids of its substories.
+    A script that is unchanged (same mtime and size, or same hash after a touch) and whose packages all reached
+    data_output/ready is skipped on the next run without being read or parsed.
+    """
+
+    def __init__(self, path="data_output/processed_scripts_index.json", ready_dir="data_output/ready"):
+        self.path = path
+        self.ready_dir = ready_dir
+        self.entries = self.load()
+
+    def load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as index_file:
+                return json.load(index_file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def save(self):
+        directory = os.path.dirname(self.path) or "."
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as tmp_file:
+            json.dump(self.entries, tmp_file, indent=4)
+        os.replace(tmp_path, self.path)
+
+    def is_unchanged(self, script_path):
+        entry = self.entries.get(script_path)
+        if entry is None:
+            return False
+        stat = os.stat(script_path)
+        if stat.st_mtime_ns == entry["mtime_ns"] and stat.st_size == entry["size"]:
+            return True
+        if hash_file(script_path) != entry["hash"]:
+            return False
+        # Same content with a new mtime, remember the new mtime so the next check needs no hashing.
+        entry["mtime_ns"] = stat.st_mtime_ns
+        entry["size"] = stat.st_size
+        self.save()
+        return True
+
+    def is_done(self, script_path):
+        """ True if the script is unchanged and every one of its packages has its video. """
+        if not self.is_unchanged(script_path):
+            return False
+        return all(os.path.isdir(os.path.join(self.ready_dir, package_id)) for package_id in self.entries[script_path]["package_ids"])
+
+    def record(self, script_path, package_ids):
+        stat = os.stat(script_path)
+        self.entries[script_path] = {
+            "mtime_ns": stat.st_mtime_ns,
+            "size": stat.st_size,
+            "hash": hash_file(script_path),
+            "package_ids": list(package_ids),
+        }
+        self.save()
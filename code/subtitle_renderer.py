@@ -0,0 +1,91 @@
+from bisect import bisect_right
+from math import ceil, floor
+from functools import lru_cache
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+
+@lru_cache(maxsize=None)
+def load_font(font, fontsize):
+    for candidate in (font, f"{font}.ttf", "DejaVuSans.ttf"):
+        try:
+            return ImageFont.truetype(candidate, fontsize)
+        except OSError:
+            continue
+    return ImageFont.load_default(fontsize)
+
+
+def rasterize_subtitle(text, font, fontsize, color):
+    """
+    Rasterizes a (possibly multi-line) subtitle with Pillow.
+    Returns (premultiplied_rgb, inverse_alpha) float32 arrays ready to be blended onto frames.
+    """
+    pil_font = load_font(font, fontsize)
+    measure = ImageDraw.Draw(Image.new("L", (1, 1)))
+    left, top, right, bottom = measure.multiline_textbbox((0, 0), text, font=pil_font, align="center")
+    left, top = floor(left), floor(top)
+    width, height = max(1, ceil(right) - left), max(1, ceil(bottom) - top)
+
+    sprite = Image.new("RGBA", (width, height), (0, 0, 0, 0))
+    ImageDraw.Draw(sprite).multiline_text((-left, -top), text, font=pil_font, fill=color, align="center")
+
+    rgba = np.asarray(sprite, dtype=np.float32) / 255.0
+    alpha = rgba[:, :, 3:4]
+    premultiplied_rgb = rgba[:, :, :3] * alpha * 255.0
+    return premultiplied_rgb, 1.0 - alpha
+
+
+class Subtitle_Renderer():
+    """
+    Draws timed subtitles onto frames with NumPy instead of compositing a TextClip per segment.
+    Frames come in time order, so only the sprite of the current segment is kept: each segment is rasterized
+    once and memory stays at one sprite per renderer, however many segments or videos are drawn.
+    """
+
+    def __init__(self, subs, font='Arial', fontsize=70, color='white'):
+        """ subs: list of ((start, end), text) as produced by Video_Editor.prepare_subs. """
+        self.subs = sorted(subs, key=lambda sub: sub[0][0])
+        self.starts = [start for (start, _), _ in self.subs]
+        self.font = font
+        self.fontsize = fontsize
+        self.color = color
+        self.sprite_text = None
+        self.sprite = None
+
+    def text_at(self, t):
+        index = bisect_right(self.starts, t) - 1
+        if index < 0:
+            return None
+        (start, end), text = self.subs[index]
+        if t >= end or not text.strip():
+            return None
+        return text
+
+    def blend(self, frame, t):
+        """ Returns `frame` with the subtitle active at time t alpha-blended at its center. """
+        text = self.text_at(t)
+        if text is None:
+            return frame
+
+        if text != self.sprite_text:
+            self.sprite = rasterize_subtitle(text, self.font, self.fontsize, self.color)
+            self.sprite_text = text
+        premultiplied_rgb, inverse_alpha = self.sprite
+        frame_h, frame_w = frame.shape[:2]
+        sprite_h, sprite_w = inverse_alpha.shape[:2]
+
+        # Clip the sprite to the frame if it is larger than the frame.
+        y = (frame_h - sprite_h) // 2
+        x = (frame_w - sprite_w) // 2
+        sprite_y, sprite_x = max(0, -y), max(0, -x)
+        y, x = max(0, y), max(0, x)
+        h, w = min(sprite_h - sprite_y, frame_h), min(sprite_w - sprite_x, frame_w)
+
+        # Frames may be read-only views of a shared source image, so draw on a copy.
+        result = np.array(frame)
+        region = result[y:y + h, x:x + w].astype(np.float32)
+        region *= inverse_alpha[sprite_y:sprite_y + h, sprite_x:sprite_x + w]
+        region += premultiplied_rgb[sprite_y:sprite_y + h, sprite_x:sprite_x + w]
+        result[y:y + h, x:x + w] = (region + 0.5).astype(np.uint8)
+        return result
@@ -0,0 +1,171 @@
+import re
+from bisect import bisect_left
+
+# Chapter tokens sent per script request.
+CHUNK_TOKENS = 8000
+# Short chapters packed into one request, each asks for its own substories so the output budget grows with it.
+MAX_CHAPTERS_PER_REQUEST = 4
+
+# Lines such as "* * *", "###" or "~" that mark a scene change inside a chapter.
+SCENE_BREAK = re.compile(r"^\s*(?:[*#~=•·-]\s*)+$")
+SENTENCE_END = re.compile(r"(?<=[.!?…])[\"'”’)]*\s+")
+
+
+def split_units(text):
+    """
+    Splits chapter text into (start, end, scene_break) character spans, one per paragraph.
+    scene_break is True when a scene break line (or the start of the text) comes right before the paragraph.
+    """
+    units = []
+    scene_break = True
+    position = 0
+    for line in text.splitlines(keepends=True):
+        start, position = position, position + len(line)
+        if SCENE_BREAK.match(line):
+            scene_break = True
+        elif line.strip():
+            units.append((start, position, scene_break))
+            scene_break = False
+    return units
+
+
+def split_sentences(text, start, end):
+    """ Character spans of the sentences of text[start:end], for paragraphs too long for one chunk. """
+    spans = []
+    for match in SENTENCE_END.finditer(text, start, end):
+        spans.append((start, match.end()))
+        start = match.end()
+    if start < end:
+        spans.append((start, end))
+    return spans
+
+
+class Text_Chunker():
+    """
+    Cuts a chapter into chunks of at most `max_tokens` tokens, only between paragraphs, preferring scene breaks.
+    Chunks aim at an even size, so the last one is only small when it cannot join the previous one within the budget.
+    A paragraph longer than a whole chunk is cut between sentences. Token counts come from the chapter's stored tokens, nothing is encoded again.
+    """
+
+    def __init__(self, encoding, max_tokens=CHUNK_TOKENS):
+        self.encoding = encoding
+        self.max_tokens = max_tokens
+
+    def chunk(self, text, tokens):
+        """ Returns [(chunk_text, token_count)] covering the whole text. """
+        if len(tokens) <= self.max_tokens:
+            return [(text, len(tokens))]
+
+        # offsets[i] is the character where token i starts, so a character span maps to a token count.
+        text, offsets = self.encoding.decode_with_offsets(list(tokens))
+
+        def token_index(position):
+            return bisect_left(offsets, position)
+
+        units = []
+        for start, end, scene_break in split_units(text):
+            if token_index(end) - token_index(start) <= self.max_tokens:
+                units.append((start, end, scene_break))
+                continue
+            for i, (sentence_start, sentence_end) in enumerate(split_sentences(text, start, end)):
+                units.extend(self.split_oversized(sentence_start, sentence_end, scene_break and i == 0, offsets, token_index))
+        sizes = [token_index(end) - token_index(start) for start, end, _ in units]
+
+        boundaries = self.plan_boundaries(sizes, [scene_break for _, _, scene_break in units])
+        chunks = []
+        for first, last in zip(boundaries, boundaries[1:]):
+            chunks.append((text[units[first][0]:units[last - 1][1]].strip(), sum(sizes[first:last])))
+        return chunks
+
+    def split_oversized(self, start, end, scene_break, offsets, token_index):
+        """ Hard cuts at token boundaries for a single sentence longer than a whole chunk. """
+        first, last = token_index(start), token_index(end)
+        if last - first <= self.max_tokens:
+            return [(start, end, scene_break)]
+        cuts = [start] + [offsets[i] for i in range(first + self.max_tokens, last, self.max_tokens)] + [end]
+        return [(cut_start, cut_end, scene_break and i == 0) for i, (cut_start, cut_end) in enumerate(zip(cuts, cuts[1:]))]
+
+    def min_chunks(self, sizes):
+        """
+        min_chunks[i] is the fewest chunks sizes[i:] fits in. Filling each chunk as far as it goes is optimal
+        for cuts that keep the order, so every entry follows from the furthest cut the budget allows.
+        """
+        counts = [0] * (len(sizes) + 1)
+        end, total = len(sizes), 0
+        for i in range(len(sizes) - 1, -1, -1):
+            total += sizes[i]
+            while total > self.max_tokens and end > i + 1:
+                end -= 1
+                total -= sizes[end]
+            counts[i] = 1 + counts[end]
+        return counts
+
+    def plan_boundaries(self, sizes, scene_breaks):
+        """
+        Greedy cut planning: each chunk ends at the paragraph boundary closest to an even share of the remaining
+        tokens, among the boundaries that fit the budget and leave a rest needing no extra request.
+        A scene break counts as if it were a tenth of the share closer. Once the rest fits the budget it is taken
+        whole, so a small last chunk never has to be folded into the previous one afterwards.
+        """
+        min_chunks = self.min_chunks(sizes)
+        boundaries = [0]
+        start = 0
+        while start < len(sizes):
+            target = sum(sizes[start:]) / min_chunks[start]
+            size = 0
+            best, best_score = None, None
+            i = start
+            while i < len(sizes) and (i == start or size + sizes[i] <= self.max_tokens):
+                size += sizes[i]
+                i += 1
+                if i == len(sizes):
+                    best = i
+                    break
+                # Cutting here must not add a request for the rest, unless no boundary avoids it.
+                fits = 1 + min_chunks[i] == min_chunks[start]
+                score = (not fits, abs(size - target) - (target / 10 if scene_breaks[i] else 0))
+                if best_score is None or score < best_score:
+                    best, best_score = i, score
+            boundaries.append(best)
+            start = best
+        return boundaries
+
+
+class Script_Part():
+    """ A whole chapter, or one chunk of a long chapter, and the script its substories are written to. """
+
+    def __init__(self, script_title, chapter_title, text, token_count, whole_chapter):
+        self.script_title = script_title
+        self.chapter_title = chapter_title
+        self.text = text
+        self.token_count = token_count
+        self.whole_chapter = whole_chapter
+
+
+def pack_parts(parts, max_tokens=CHUNK_TOKENS, max_chapters=MAX_CHAPTERS_PER_REQUEST):
+    """
+    Next-fit bin packing in book order: adjacent whole chapters share a request while their tokens fit `max_tokens`.
+    Chunks of long chapters are already close to full and always get a request of their own.
+    Yields each request's list of parts as soon as it is complete, so chapters can still be streamed in.
+    """
+    batch, batch_tokens = [], 0
+    for part in parts:
+        if batch and (not part.whole_chapter or batch_tokens + part.token_count > max_tokens or len(batch) >= max_chapters):
+            yield batch
+            batch, batch_tokens = [], 0
+        batch.append(part)
+        batch_tokens += part.token_count
+        if not part.whole_chapter:
+            yield batch
+            batch, batch_tokens = [], 0
+    if batch:
+        yield batch
+
+
+def utilization_report(requests, max_tokens=CHUNK_TOKENS):
+    """ Prints how many requests pack_parts produced and how full each one is, `requests` being its batches of parts. """
+    utilization = [round(100 * sum(part.token_count for part in parts) / max_tokens) for parts in requests]
+    average = round(sum(utilization) / len(utilization)) if utilization else 0
+    print(f"{len(requests)} request(s) for {sum(len(parts) for parts in requests)} chapter part(s), "
+          f"token utilization {average}% on average: " + ", ".join(f"{percent}%" for percent in utilization))
+    return utilization
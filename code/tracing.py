@@ -0,0 +1,242 @@
+"""
+Stage-level timing and cost instrumentation.
+
+Every span is appended as one JSON line to the trace file, from any thread or process of the run.
+Spans are only written once tracing is enabled, either with `tracer.configure(path)`
+or the PIPELINE_TRACE environment variable (inherited by worker processes).
+
+Usage:
+    python3 tracing.py summary <trace.jsonl>                per stage and per package summary tables
+    python3 tracing.py chrome <trace.jsonl> <trace.json>    export for chrome://tracing or Perfetto
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import threading
+import contextvars
+from pathlib import Path
+from contextlib import contextmanager
+
+from prettytable import PrettyTable
+
+TRACE_ENV = "PIPELINE_TRACE"
+
+# USD list prices, update them when OpenAI's pricing changes.
+CHAT_PRICES = {"gpt-4o": (2.50 / 1e6, 10.00 / 1e6), "gpt-4o-mini": (0.15 / 1e6, 0.60 / 1e6)}  # (input, output) per token
+IMAGE_PRICES = {("dall-e-3", "standard", "1024x1024"): 0.040, ("dall-e-3", "hd", "1024x1024"): 0.080}  # per image
+SPEECH_PRICES = {"tts-1": 15.00 / 1e6, "tts-1-hd": 30.00 / 1e6}  # per input character
+
+# Attributes summed per span name in the summary table.
+COUNTERS = ["retries", "prompt_rewrites", "cache_hits", "wait_seconds", "api_seconds",
+            "tokens_in", "tokens_out", "bytes_written", "frames_encoded", "cost_usd"]
+
+
+def chat_cost(model, tokens_in, tokens_out):
+    input_price, output_price = CHAT_PRICES.get(model, (0.0, 0.0))
+    return tokens_in * input_price + tokens_out * output_price
+
+
+def image_cost(model, quality, size):
+    return IMAGE_PRICES.get((model, quality, size), 0.0)
+
+
+def speech_cost(model, characters):
+    return characters * SPEECH_PRICES.get(model, 0.0)
+
+
+class Span():
+    def __init__(self, name, parent=None, **attributes):
+        self.id = uuid.uuid4().hex[:16]
+        self.name = name
+        self.parent = parent
+        self.attributes = {}
+        # Spans of a package's stage keep its id, so the summary can split time and cost per package.
+        if parent is not None and "package" in parent.attributes:
+            self.attributes["package"] = parent.attributes["package"]
+        self.attributes.update(attributes)
+        self.start = time.time()
+        self.duration = None
+
+    def set(self, key, value):
+        self.attributes[key] = value
+
+    def add(self, key, amount=1):
+        self.attributes[key] = self.attributes.get(key, 0) + amount
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "parent": self.parent.id if self.parent is not None else None,
+            "name": self.name,
+            "start": self.start,
+            "duration": self.duration,
+            "pid": os.getpid(),
+            "tid": threading.get_ident(),
+            "attributes": self.attributes,
+        }
+
+
+class Tracer():
+    """
+    Records nested spans. The innermost open span of the current thread is the one `add` and `set` update,
+    so API calls report latency, tokens and cost to whichever stage span they run under.
+    Thread pool tasks submitted through `wrap` keep the submitting span as their parent.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or os.environ.get(TRACE_ENV)
+        self.lock = threading.Lock()
+        self.current_span = contextvars.ContextVar("current_span", default=None)
+
+    @property
+    def enabled(self):
+        return self.path is not None
+
+    def configure(self, path):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        os.environ[TRACE_ENV] = path
+
+    def current(self):
+        return self.current_span.get()
+
+    @contextmanager
+    def span(self, name, **attributes):
+        span = Span(name, self.current(), **attributes)
+        token = self.current_span.set(span)
+        start = time.perf_counter()
+        try:
+            yield span
+        except BaseException as e:
+            span.set("error", repr(e))
+            raise
+        finally:
+            span.duration = time.perf_counter() - start
+            self.current_span.reset(token)
+            self.write(span)
+
+    def record(self, name, start, duration, **attributes):
+        """ Writes a span measured by the caller, e.g. one spanning the iteration of a generator. """
+        span = Span(name, self.current(), **attributes)
+        span.start = start
+        span.duration = duration
+        self.write(span)
+
+    def add(self, key, amount=1):
+        span = self.current()
+        if span is not None:
+            span.add(key, amount)
+
+    def set(self, key, value):
+        span = self.current()
+        if span is not None:
+            span.set(key, value)
+
+    def wrap(self, function):
+        """ Runs `function` under the span that is current now, whichever thread ends up calling it. """
+        parent = self.current()
+
+        def run_in_span(*args, **kwargs):
+            token = self.current_span.set(parent)
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.current_span.reset(token)
+        return run_in_span
+
+    def write(self, span):
+        if not self.enabled:
+            return
+        line = json.dumps(span.to_dict(), default=str) + "\n"
+        with self.lock:
+            # One append per line, so threads and processes of the same run can share the file.
+            with open(self.path, "a", encoding="utf-8") as trace_file:
+                trace_file.write(line)
+
+
+tracer = Tracer()
+
+
+def load_trace(path):
+    with open(path, "r", encoding="utf-8") as trace_file:
+        return [json.loads(line) for line in trace_file if line.strip()]
+
+
+def summarize(spans):
+    """
+    Prints one row per span name (wall times include child spans) and one row per package.
+    Counters such as tokens and cost are only added to the innermost span, so their totals are not double counted.
+    """
+    rows = {}
+    for span in spans:
+        row = rows.setdefault(span["name"], {"calls": 0, "errors": 0, "wall": 0.0, **{key: 0 for key in COUNTERS}})
+        row["calls"] += 1
+        row["errors"] += "error" in span["attributes"]
+        row["wall"] += span["duration"]
+        for key in COUNTERS:
+            row[key] += span["attributes"].get(key, 0)
+
+    table = PrettyTable()
+    table.field_names = ["Span", "Calls", "Errors", "Wall total (s)", "Wall mean (s)", "API (s)", "Throttled (s)", "Retries",
+                         "Rewrites", "Cache hits", "Tokens in", "Tokens out", "Written (MB)", "Frames", "Cost ($)"]
+    for name, row in sorted(rows.items(), key=lambda item: -item[1]["wall"]):
+        table.add_row([name, row["calls"], row["errors"], round(row["wall"], 2), round(row["wall"] / row["calls"], 3),
+                       round(row["api_seconds"], 2), round(row["wait_seconds"], 2), row["retries"], row["prompt_rewrites"],
+                       row["cache_hits"], row["tokens_in"], row["tokens_out"],
+                       round(row["bytes_written"] / 1024**2, 2), row["frames_encoded"], round(row["cost_usd"], 4)])
+    print(table)
+
+    packages = {}
+    for span in spans:
+        package = span["attributes"].get("package")
+        if package is None:
+            continue
+        totals = packages.setdefault(package, {"stages": {}, "cost_usd": 0.0, "tokens": 0})
+        if span["name"] in ("images", "audio", "video"):
+            totals["stages"][span["name"]] = totals["stages"].get(span["name"], 0.0) + span["duration"]
+        totals["cost_usd"] += span["attributes"].get("cost_usd", 0)
+        totals["tokens"] += span["attributes"].get("tokens_in", 0) + span["attributes"].get("tokens_out", 0)
+
+    if packages:
+        table = PrettyTable()
+        table.field_names = ["Package", "Images (s)", "Audio (s)", "Video (s)", "Tokens", "Cost ($)"]
+        for package, totals in sorted(packages.items()):
+            stages = totals["stages"]
+            table.add_row([package, round(stages.get("images", 0), 2), round(stages.get("audio", 0), 2),
+                           round(stages.get("video", 0), 2), totals["tokens"], round(totals["cost_usd"], 4)])
+        print(table)
+
+    print(f"Total cost: ${sum(row['cost_usd'] for row in rows.values()):.4f}")
+
+
+def export_chrome_trace(spans, output_path):
+    """ Writes the spans as complete ("X") events of the Chrome trace event format. """
+    origin = min((span["start"] for span in spans), default=0)
+    events = [{
+        "name": span["name"],
+        "ph": "X",
+        "ts": (span["start"] - origin) * 1e6,
+        "dur": span["duration"] * 1e6,
+        "pid": span["pid"],
+        "tid": span["tid"],
+        "args": span["attributes"],
+    } for span in spans]
+    with open(output_path, "w", encoding="utf-8") as output_file:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, output_file)
+    return output_path
+
+
+def main():
+    args = sys.argv[1:]
+    if len(args) >= 2 and args[0] == "summary":
+        summarize(load_trace(args[1]))
+    elif len(args) >= 3 and args[0] == "chrome":
+        print(f"Chrome trace written to {export_chrome_trace(load_trace(args[1]), args[2])}")
+    else:
+        print(__doc__)
+
+
+if __name__ == "__main__":
+    main()
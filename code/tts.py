@@ -1,42 +1,98 @@
 import json
 import base64
 from pathlib import Path
-from openai import OpenAI
-from dotenv import dotenv_values
-import random as rd
+from concurrent.futures import ThreadPoolExecutor
+from openai_client import make_client, cache_dir
 import script_creation
+from cache import Disk_Cache, replace_file
+from package_manifest import hash_content
+from tracing import tracer, speech_cost
+from rate_limiter import get_scheduler, classify_error, CONTENT_POLICY
+
+VOICES = ["fable", "shimmer", "echo", "onyx"]
+
+
+def pick_voice(prompts):
+    """ The substory's voice, derived from its lines so reruns hit the cache and keep the same narrator. """
+    return VOICES[int(hash_content(prompts), 16) % len(VOICES)]
+
 
 class Speech_Generator():
 
-    def __init__(self):
-        config = dotenv_values(".env")
-        self.client = OpenAI(api_key=config.get("API_KEY"), project=config.get("PROJECT_ID"))
-        self.sc = script_creation.Script_Generator()
+    def __init__(self, client=None, max_workers=4, cache=None, scheduler=None, script_generator=None):
+        """
+        client: optional OpenAI compatible client, e.g. a local fake for testing.
+        max_workers: maximum number of lines synthesized at the same time.
+        cache: Disk_Cache for synthesized lines, shared by all packages through cache_dir("audio") by default.
+        scheduler: rate_limiter.Request_Scheduler, defaults to the one shared by the whole process.
+        script_generator: Script_Generator used to rewrite rejected lines, built on the same client by default.
+        """
+        if client is None:
+            client = make_client()
+        self.client = client
+        self.scheduler = scheduler or get_scheduler()
+        self.sc = script_generator or script_creation.Script_Generator(client=client, scheduler=self.scheduler)
+        self.max_workers = max_workers
+        if cache is None:
+            cache = Disk_Cache(cache_dir("audio"), suffix=".mp3", max_bytes=1024**3)
+        self.cache = cache
+        self.model = "tts-1"
 
 
-    def generate_audio(self, audio_path, prompts):
+    def generate_audio(self, audio_path, prompts, max_workers=None, voice=None):
+        """
+        Synthesizes all lines concurrently with a single voice for the whole substory, pick_voice(prompts) by default.
+        audio_{i}.mp3 always holds prompts[i], whatever order the requests finish in.
+        """
         Path(audio_path).mkdir(parents=True, exist_ok=True)
-        
-        voices = ["fable", "shimmer", "echo", "onyx"]
-        voice = rd.choice(voices)
 
-        for i, prompt in enumerate(prompts):
+        voice = voice or pick_voice(prompts)
+
+        if max_workers is None:
+            max_workers = self.max_workers
+        workers = max(1, min(max_workers, len(prompts)))
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(tracer.wrap(self.generate_line_with_fallback), f"{audio_path}/audio_{i}.mp3", prompt, voice)
+                for i, prompt in enumerate(prompts)
+            ]
+            for future in futures:
+                future.result()
+
+        stats = self.cache.stats()
+        print(f"Audio files generated successfully! (cache hits: {stats['hits']}, misses: {stats['misses']})")
+
+
+    def generate_line_with_fallback(self, audio_path, prompt, voice):
+        with tracer.span("generate_line", path=audio_path, voice=voice) as span:
             try:
-                self.generate_line(f"{audio_path}/audio_{i}.mp3", prompt, voice)
+                self.generate_line(audio_path, prompt, voice)
             except Exception as e:
+                if classify_error(e) != CONTENT_POLICY:
+                    raise
+                span.add("prompt_rewrites")
                 new_prompt = self.sc.regenerate_script_line(prompt)
-                self.generate_line(f"{audio_path}/audio_{i}.mp3", new_prompt, voice)
+                self.generate_line(audio_path, new_prompt, voice)
 
-        print("Audio files generated successfully!")
-        
 
     def generate_line(self, audio_path, prompt, voice= 'Onyx'):
-        response = self.client.audio.speech.create(model="tts-1",
-                                              voice=voice,
-                                              input=prompt,
-                                            )
-
-        with open(audio_path, "wb") as audio_file:
-            audio_file.write(response.content)
-       
+        # A line already synthesized with the same model and voice is reused without a network call.
+        cache_key = Disk_Cache.make_key(self.model, voice, prompt)
+        if self.cache.link_into(cache_key, audio_path):
+            tracer.add("cache_hits")
+            return
+
+        response = self.scheduler.call("speech", self.client.audio.speech.create,
+                                       model=self.model,
+                                       voice=voice,
+                                       input=prompt,
+                                       )
+        tracer.add("cost_usd", speech_cost(self.model, len(prompt)))
+
+        # audio_path may still be a hard link to another line's cached audio, replace it instead of writing into it.
+        replace_file(audio_path, response.content)
+        tracer.add("bytes_written", len(response.content))
+
+        self.cache.put_bytes(cache_key, response.content)
 
@@ -4,69 +4,86 @@ if not hasattr(Image, 'ANTIALIAS'):
     # Pillow 10+ removed ANTIALIAS in favor of Resampling.LANCZOS.
     Image.ANTIALIAS = Image.Resampling.LANCZOS
 
-from moviepy.editor import (
-    AudioFileClip, ImageClip, concatenate_videoclips,
-    TextClip, CompositeVideoClip, VideoFileClip
-)
-from moviepy.video.tools.subtitles import SubtitlesClip
+from moviepy.editor import AudioFileClip, VideoClip, concatenate_videoclips, VideoFileClip
 import json
 import sys
 from math import ceil
-from moviepy.config import change_settings
-change_settings({"IMAGEMAGICK_BINARY": "magick"})
+import os
+import tempfile
+import numpy as np
+from itertools import groupby
+from ffmpeg_writer import FFmpeg_Writer, encode_still, concat_segments
+from package_index import Package_Index
+from pan_renderer import Pan_Renderer
+from subtitle_renderer import Subtitle_Renderer
+from tracing import tracer
 
 
 class Video_Editor():
 
-    def __init__(self):
+    def __init__(self, easing="linear", zoom_start=1.0, zoom_end=1.0,
+                 backend="moviepy", codec="libx264", preset="medium", crf=23, threads=None):
+        """
+        easing: pan_renderer.EASINGS curve used for the pan and zoom of each image.
+        zoom_start, zoom_end: zoom applied at the start and end of each image, 1.0 keeps the plain pan.
+        backend: "moviepy" (write_videofile) or "ffmpeg" (frames piped straight into an ffmpeg subprocess).
+        codec, preset, crf, threads: encoder settings used by the ffmpeg backend.
+        """
         self.clips = []
         self.width = 1080
         self.height = 1920
+        self.fps = 24
+        self.easing = easing
+        self.zoom_start = zoom_start
+        self.zoom_end = zoom_end
+        self.backend = backend
+        self.codec = codec
+        self.preset = preset
+        self.crf = crf
+        self.threads = threads
     
     def add_captions(self, video, subs):
         """
         Adds subtitles (subs) on top of the given 'video'.
-        Ensures we don't pass an empty string to TextClip.
+        Each segment is rasterized once with Pillow and blended onto the frames of its time window,
+        so no ImageMagick TextClip or CompositeVideoClip is involved.
         """
-        def textclip_generator(txt):
-            if not txt.strip():
-                txt = " "
-            return TextClip(txt, font='Arial', fontsize=70, color='white')
-        
-        subtitles = SubtitlesClip(subs, textclip_generator)
-        result = CompositeVideoClip([video, subtitles.set_pos(('center','center'))])
+        renderer = Subtitle_Renderer(subs, font='Arial', fontsize=70, color='white')
+        result = video.fl(lambda get_frame, t: renderer.blend(get_frame(t), t))
         return result 
 
-    def generate_video(self, path, story=None):
+    def generate_video(self, path, story=None, index=None):
+        """
+        Renders every chunk listed by the package's Package_Index, built here unless the caller already has one.
+        Incomplete packages are rejected before any audio or image is decoded.
+        """
+        with tracer.span("generate_video", backend=self.backend) as span:
+            if index is None:
+                index = Package_Index(path)
+            index.validate()
+            span.set("video_seconds", round(index.total_duration, 3))
+            self.render_video(path, index, story)
+            span.add("bytes_written", os.path.getsize(f"{path}/video.mp4"))
+
+    def render_video(self, path, index, story=None):
         clips = []
         durations = []
 
-        image_files = [f"{path}/images/image_{i}.png" for i in range(0, 5)]
-        audio_files = [f"{path}/audio/audio_{i}.mp3" for i in range(0, 5)]
+        image_files = index.image_files
+        audio_files = index.audio_files
+
+        if self.backend == "ffmpeg":
+            return self.generate_video_ffmpeg(path, image_files, audio_files, index.durations, story)
     
         for img_path, aud_path in zip(image_files, audio_files):
             audio = AudioFileClip(aud_path)
             duration = audio.duration
             durations.append(duration)
         
-            clip = ImageClip(img_path).set_duration(duration)
+            # The image is resized once, every frame is then sliced out of the same array.
+            renderer = self.make_renderer(img_path, duration)
+            clip = VideoClip(renderer.frame, duration=duration)
             clip = clip.set_audio(audio)
-        
-            clip = clip.resize(height=self.height)
-        
-            if clip.w > self.width:
-                max_shift = clip.w - self.width
-        
-                def crop_func(get_frame, t):
-                    frame = get_frame(t)
-                    current_x = int(max_shift * t / duration)
-                    return frame[0:self.height, current_x:current_x+self.width]
-        
-                clip = clip.fl(crop_func, apply_to=['mask'])
-            else:
-                clip = clip.on_color(size=(self.width, self.height),
-                                     color=(0, 0, 0),
-                                     pos='center')
             clips.append(clip)
         
         final_clip = concatenate_videoclips(clips)
@@ -75,8 +92,73 @@ class Video_Editor():
             subtitles = self.prepare_subs(story['lines'], durations)
             final_clip = self.add_captions(final_clip, subtitles)
         
-        final_clip.write_videofile(f"{path}/video.mp4", fps=24)
+        with tracer.span("write_videofile") as span:
+            final_clip.write_videofile(f"{path}/video.mp4", fps=self.fps)
+            span.add("frames_encoded", int(final_clip.duration * self.fps))
 
+    def generate_video_ffmpeg(self, path, image_files, audio_files, durations, story=None):
+        """
+        Same output as the moviepy path, but every chunk is encoded as its own segment by ffmpeg
+        and the segments are joined with the concat demuxer, which also muxes the audio.
+        Panning chunks pipe their frames one at a time. Still chunks are split where the subtitle changes,
+        and each piece is a short segment encoded once and repeated by the concat demuxer (see encode_still),
+        so their cost does not grow with their duration.
+        """
+        renderers = [self.make_renderer(img_path, duration) for img_path, duration in zip(image_files, durations)]
+        subtitles = None
+        if story is not None:
+            subtitles = Subtitle_Renderer(self.prepare_subs(story['lines'], durations), font='Arial', fontsize=70, color='white')
+
+        # Frames sit on one global timeline, like concatenate_videoclips, so the video stays in sync with the audio.
+        starts = np.cumsum([0] + durations[:-1])
+        frame_times = np.arange(0, sum(durations), 1.0 / self.fps)
+        bounds = list(np.searchsorted(frame_times, starts, side='left')) + [len(frame_times)]
+        encoder_options = {"codec": self.codec, "preset": self.preset, "crf": self.crf, "threads": self.threads}
+
+        with tempfile.TemporaryDirectory() as segment_dir, tracer.span("ffmpeg_encode") as span:
+            segments = []
+            for index, renderer in enumerate(renderers):
+                times = frame_times[bounds[index]:bounds[index + 1]]
+                if len(times) == 0:
+                    continue
+
+                if renderer.is_static:
+                    for frame, num_frames in self.still_runs(renderer, times, subtitles):
+                        segment_path = os.path.join(segment_dir, f"segment_{len(segments)}.mp4")
+                        segments.extend(encode_still(frame, num_frames, segment_path, fps=self.fps, **encoder_options))
+                        span.add("frames_encoded", num_frames)
+                    continue
+
+                segment_path = os.path.join(segment_dir, f"segment_{len(segments)}.mp4")
+                with FFmpeg_Writer(segment_path, self.width, self.height, fps=self.fps, **encoder_options) as writer:
+                    for t in times:
+                        frame = renderer.frame(t - starts[index])
+                        if subtitles is not None:
+                            frame = subtitles.blend(frame, t)
+                        writer.write_frame(frame)
+                span.add("frames_encoded", writer.frames_written)
+                segments.append(segment_path)
+
+            concat_segments(segments, f"{path}/video.mp4", audio_files=audio_files)
+
+    def still_runs(self, renderer, times, subtitles=None):
+        """
+        Groups the frame times of a still chunk into runs showing the same subtitle.
+        Yields (frame, number of frames) once per run.
+        """
+        def subtitle_at(t):
+            return subtitles.text_at(t) if subtitles is not None else None
+
+        for text, run in groupby(times, key=subtitle_at):
+            run = list(run)
+            frame = renderer.static_frame
+            if text is not None:
+                frame = subtitles.blend(frame, run[0])
+            yield frame, len(run)
+
+    def make_renderer(self, img_path, duration):
+        return Pan_Renderer(img_path, self.width, self.height, duration,
+                            easing=self.easing, zoom_start=self.zoom_start, zoom_end=self.zoom_end)
 
     def prepare_subs(self, lines, durations):
         """
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The pipeline modules import each other by name from code/, as when content_pipeline.py is run from there.
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "code"))
@@ -0,0 +1,87 @@
+import os
+
+from cache import Disk_Cache, replace_file
+
+
+def test_put_bytes_then_get_returns_entry(tmp_path):
+    cache = Disk_Cache(tmp_path / "cache", suffix=".png")
+    key = Disk_Cache.make_key("dall-e-3", "a prompt")
+    cache.put_bytes(key, b"image")
+
+    assert cache.get(key).read_bytes() == b"image"
+    assert cache.get(Disk_Cache.make_key("dall-e-3", "another prompt")) is None
+    assert cache.stats() == {"hits": 1, "misses": 1}
+
+
+def test_link_into_hit_and_miss(tmp_path):
+    cache = Disk_Cache(tmp_path / "cache", suffix=".png")
+    key = Disk_Cache.make_key("a")
+    destination = tmp_path / "package" / "image_0.png"
+
+    assert not cache.link_into(key, destination)
+    assert not destination.exists()
+
+    cache.put_bytes(key, b"A")
+    assert cache.link_into(key, destination)
+    assert destination.read_bytes() == b"A"
+
+
+def test_replacing_linked_output_keeps_cache_entry(tmp_path):
+    # Regression: writing a miss into a path that is a hard link to another entry overwrote that entry.
+    cache = Disk_Cache(tmp_path / "cache", suffix=".png")
+    key_a, key_b = Disk_Cache.make_key("a"), Disk_Cache.make_key("b")
+    destination = tmp_path / "package" / "image_0.png"
+    cache.put_bytes(key_a, b"A")
+    cache.link_into(key_a, destination)
+
+    replace_file(destination, b"B")
+    cache.put_bytes(key_b, b"B")
+
+    assert destination.read_bytes() == b"B"
+    assert cache.get(key_a).read_bytes() == b"A"
+    assert cache.get(key_b).read_bytes() == b"B"
+
+
+def test_replace_file_leaves_no_temporary_files(tmp_path):
+    destination = tmp_path / "out" / "audio_0.mp3"
+    replace_file(destination, b"one")
+    replace_file(destination, b"two")
+
+    assert destination.read_bytes() == b"two"
+    assert os.listdir(destination.parent) == ["audio_0.mp3"]
+
+
+def test_evicts_oldest_entries_past_max_bytes(tmp_path):
+    cache = Disk_Cache(tmp_path / "cache", max_bytes=10)
+    old_key, new_key = Disk_Cache.make_key("old"), Disk_Cache.make_key("new")
+    old_path = cache.put_bytes(old_key, b"x" * 6)
+    os.utime(old_path, (1, 1))
+    cache.put_bytes(new_key, b"y" * 6)
+
+    assert cache.get(old_key) is None
+    assert cache.get(new_key) is not None
+
+
+def test_puts_below_the_limit_do_not_scan(tmp_path, monkeypatch):
+    cache = Disk_Cache(tmp_path / "cache", max_bytes=100)
+    scans = []
+    monkeypatch.setattr(cache, "evict", lambda: scans.append(1))
+    for i in range(10):
+        cache.put_bytes(Disk_Cache.make_key(i), b"x" * 5)
+    cache.put_bytes(Disk_Cache.make_key(0), b"x" * 9)  # Replacing an entry only counts the difference.
+
+    assert scans == []
+    assert cache.total_bytes == 54
+
+
+def test_total_is_seeded_from_existing_entries(tmp_path):
+    first = Disk_Cache(tmp_path / "cache", max_bytes=10)
+    old_path = first.put_bytes(Disk_Cache.make_key("old"), b"x" * 6)
+    os.utime(old_path, (1, 1))
+
+    second = Disk_Cache(tmp_path / "cache", max_bytes=10)
+    assert second.total_bytes == 6
+    second.put_bytes(Disk_Cache.make_key("new"), b"y" * 6)
+
+    assert not old_path.exists()
+    assert second.total_bytes == 6
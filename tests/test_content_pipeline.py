@@ -0,0 +1,19 @@
+import json
+
+from content_pipeline import is_ready_for_video
+from fake_openai import synthetic_png, synthetic_mp3
+from package_manifest import Package_Manifest
+
+
+def test_manifest_alone_is_not_a_substory(tmp_path):
+    (tmp_path / "images").mkdir()
+    (tmp_path / "audio").mkdir()
+    for i in range(2):
+        (tmp_path / "images" / f"image_{i}.png").write_bytes(synthetic_png(i, "64x64"))
+        (tmp_path / "audio" / f"audio_{i}.mp3").write_bytes(synthetic_mp3(2.0))
+    Package_Manifest(str(tmp_path)).record("images", "hash", ["images/image_0.png", "images/image_1.png"])
+
+    assert not is_ready_for_video(str(tmp_path))
+
+    (tmp_path / "chapter_0.json").write_text(json.dumps({"title": "A"}), encoding="utf-8")
+    assert is_ready_for_video(str(tmp_path))
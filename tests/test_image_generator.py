@@ -0,0 +1,77 @@
+import re
+import time
+import base64
+import threading
+from types import SimpleNamespace
+
+import openai
+import pytest
+
+from cache import Disk_Cache
+from fake_openai import Fake_OpenAI
+from image_generator import Image_Generator
+from rate_limiter import Request_Scheduler
+from script_creation import Script_Generator
+
+UNLIMITED = {"chat": 60000, "images": 60000, "speech": 60000}
+PROMPTS = [f"prompt {i}" for i in range(6)]
+
+
+class Echo_OpenAI(Fake_OpenAI):
+    """ Returns each prompt as its image bytes, and answers later prompts first. """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.completed = []
+        self.completed_lock = threading.Lock()
+
+    def generate_image(self, model, prompt, **kwargs):
+        index = int(re.search(r"prompt (\d+)", prompt).group(1))
+        time.sleep(0.02 * (len(PROMPTS) - index))
+        super().generate_image(model, prompt, **kwargs)
+        with self.completed_lock:
+            self.completed.append(index)
+        return SimpleNamespace(data=[SimpleNamespace(b64_json=base64.b64encode(prompt.encode("utf-8")).decode("ascii"))])
+
+
+def make_generator(client, tmp_path):
+    scheduler = Request_Scheduler(rate_limits=UNLIMITED, max_retries=0)
+    script_generator = Script_Generator(client=client, cache=Disk_Cache(tmp_path / "chat"), scheduler=scheduler)
+    return Image_Generator(client=client, cache=Disk_Cache(tmp_path / "images", suffix=".png"),
+                           scheduler=scheduler, script_generator=script_generator)
+
+
+def test_images_keep_prompt_order_when_requests_finish_out_of_order(tmp_path):
+    client = Echo_OpenAI(latency=(0.0, 0.01))
+    make_generator(client, tmp_path).generate_images(str(tmp_path), PROMPTS, "context", max_in_flight=len(PROMPTS))
+
+    assert client.completed != sorted(client.completed)
+    for i, prompt in enumerate(PROMPTS):
+        assert (tmp_path / f"image_{i}.png").read_bytes().decode("utf-8").startswith(f"context {prompt} ")
+
+
+def test_rejected_prompts_are_rewritten(tmp_path):
+    # Seed 12 rejects two prompts, and neither rewrite.
+    client = Fake_OpenAI(latency=(0.0, 0.002), policy_failure_rate=0.3, seed=12)
+    make_generator(client, tmp_path).generate_images(str(tmp_path), PROMPTS, "context", max_in_flight=1)
+
+    assert client.requests["chat"] == client.failures > 0
+    assert all((tmp_path / f"image_{i}.png").exists() for i in range(len(PROMPTS)))
+
+
+def test_transient_errors_are_not_rewritten_and_propagate(tmp_path):
+    # Seed 1 fails two of the six requests.
+    client = Fake_OpenAI(failure_rate=0.3, seed=1)
+    with pytest.raises((openai.RateLimitError, openai.APIConnectionError)):
+        make_generator(client, tmp_path).generate_images(str(tmp_path), PROMPTS, "context")
+
+    assert client.failures > 0
+    assert client.requests["chat"] == 0
+
+
+def test_rejected_rewrite_propagates(tmp_path):
+    client = Fake_OpenAI(policy_failure_rate=1.0)
+    with pytest.raises(openai.BadRequestError):
+        make_generator(client, tmp_path).generate_images(str(tmp_path), PROMPTS[:1], "context")
+
+    assert client.requests == {"chat": 1, "images": 2, "speech": 0}
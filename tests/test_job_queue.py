@@ -0,0 +1,101 @@
+import time
+
+import pytest
+
+from job_queue import Job_Queue
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return Job_Queue(str(tmp_path / "jobs.sqlite"), max_attempts=2, lease_seconds=60, retry_backoff=0)
+
+
+def expire_leases(queue):
+    with queue.connect() as connection:
+        connection.execute("UPDATE jobs SET lease_expires = ? WHERE status = 'leased'", (time.time() - 1,))
+
+
+def test_enqueue_ignores_duplicates_and_unknown_stages(queue):
+    queue.enqueue("packages/a", "images", {"story": 1})
+    queue.enqueue("packages/a", "images", {"story": 2})
+
+    assert queue.counts() == {"pending": 1}
+    assert queue.lease("worker")["payload"] == {"story": 1}
+    with pytest.raises(ValueError):
+        queue.enqueue("packages/a", "upload", {})
+
+
+def test_video_waits_for_images_and_tts(queue):
+    queue.enqueue("packages/a", "video", {})
+    queue.enqueue("packages/a", "images", {})
+    queue.enqueue("packages/a", "tts", {})
+
+    images = queue.lease("worker")
+    tts = queue.lease("worker")
+    assert {images["stage"], tts["stage"]} == {"images", "tts"}
+    assert queue.lease("worker") is None
+
+    queue.complete(images["id"], "worker")
+    queue.complete(tts["id"], "worker")
+    assert queue.lease("worker")["stage"] == "video"
+
+
+def test_expired_lease_is_handed_to_another_worker(queue):
+    queue.enqueue("packages/a", "images", {})
+    job = queue.lease("worker-1")
+    assert queue.lease("worker-2") is None
+
+    expire_leases(queue)
+    retried = queue.lease("worker-2")
+    assert retried["id"] == job["id"]
+    assert retried["attempts"] == 2
+    # The first worker lost its lease, it can neither renew nor complete the job.
+    assert not queue.heartbeat(job["id"], "worker-1")
+    queue.complete(job["id"], "worker-1")
+    assert queue.counts() == {"leased": 1}
+
+
+def test_expired_lease_out_of_attempts_is_dead_lettered(queue):
+    queue.enqueue("packages/a", "images", {})
+    queue.lease("worker")
+    expire_leases(queue)
+    queue.lease("worker")
+    expire_leases(queue)
+
+    assert queue.lease("worker") is None
+    assert [job["last_error"] for job in queue.dead_letters()] == ["lease expired"]
+
+
+def test_failures_retry_then_dead_letter_dependents(queue):
+    queue.enqueue("packages/a", "images", {})
+    queue.enqueue("packages/a", "tts", {})
+    queue.enqueue("packages/a", "video", {})
+
+    for _ in range(2):
+        job = queue.lease("worker")
+        assert job["stage"] == "images"
+        queue.fail(job["id"], "worker", "boom")
+
+    dead = {job["stage"]: job["last_error"] for job in queue.dead_letters()}
+    assert dead == {"images": "boom", "video": "dependency failed"}
+    assert queue.counts() == {"dead": 2, "pending": 1}
+
+
+def test_dead_letters_can_be_requeued(queue):
+    queue.enqueue("packages/a", "images", {"story": 1})
+    queue.enqueue("packages/b", "images", {"story": 1})
+    for _ in range(4):
+        job = queue.lease("worker")
+        queue.fail(job["id"], "worker", "outage")
+    assert queue.counts() == {"dead": 2}
+
+    # Queueing a package again revives its dead job with the new payload.
+    queue.enqueue("packages/a", "images", {"story": 2})
+    job = queue.lease("worker")
+    assert (job["package_dir"], job["payload"], job["attempts"]) == ("packages/a", {"story": 2}, 1)
+    queue.complete(job["id"], "worker")
+
+    assert queue.requeue_dead() == 1
+    assert queue.counts() == {"done": 1, "pending": 1}
+    queue.enqueue("packages/a", "images", {"story": 3})
+    assert queue.counts() == {"done": 1, "pending": 1}
@@ -0,0 +1,161 @@
+import json
+
+import pytest
+
+import script_creation
+from cache import Disk_Cache
+from fake_openai import Fake_OpenAI
+from rate_limiter import Request_Scheduler
+from text_chunker import Script_Part
+from script_creation import parse_substories, write_substories, stream_script, validate_substory, Script_Generator
+
+SCRIPT = """**Substory Title**: The Jostling Above Joura
+
+**Script**:
+Chunk 1: High above Joura, low-orbit traffic thickened.
+Chunk 2: Roboute maneuvered the Renard through the maze.
+Chunk 3: The bridge was polished wood and glowing data.
+Chunk 4: Emil and Ilanna debated the ship's movements.
+Chunk 5: Past mishaps sent a chill through the crew.
+
+**Image Prompts**:
+Chunk 1 Prompt: Ships in orbit around a blue planet.
+Chunk 2 Prompt: A small spacecraft among imposing vessels.
+Chunk 3 Prompt: A command bridge with wood panels and holograms.
+Chunk 4 Prompt: Two crew members in a tense discussion.
+Chunk 5 Prompt: An anxious crew gazing at a busy space scene.
+
+**General Script Prompt**: A futuristic starship orbiting a vibrant planet.
+
+**Substory Title**: Too Short
+
+**Script**:
+Chunk 1: Only one line.
+"""
+
+
+def test_parse_substories_reads_every_section():
+    substories = list(parse_substories(SCRIPT.splitlines()))
+
+    assert [substory["title"] for substory in substories] == ["The Jostling Above Joura", "Too Short"]
+    first = substories[0]
+    assert first["lines"][0] == "High above Joura, low-orbit traffic thickened."
+    assert first["prompts"][4] == "An anxious crew gazing at a busy space scene."
+    assert first["general_prompt"] == "A futuristic starship orbiting a vibrant planet."
+    assert validate_substory(first) and not validate_substory(substories[1])
+
+
+def test_stream_and_write_round_trip(tmp_path):
+    script_path = tmp_path / "chapter_0.txt"
+    script_path.write_text(SCRIPT, encoding="utf-8")
+    json_path = tmp_path / "chapter_0.json"
+
+    streamed = list(write_substories(stream_script(str(script_path)), str(json_path)))
+
+    assert [substory["title"] for substory in streamed] == ["The Jostling Above Joura"]
+    # Byte for byte what json.dumps(indent=4) of the whole script writes.
+    assert json_path.read_text(encoding="utf-8") == json.dumps({"substories": streamed}, indent=4)
+    assert not (tmp_path / "chapter_0.json.tmp").exists()
+
+
+def test_write_substories_without_substories_writes_nothing(tmp_path):
+    json_path = tmp_path / "empty.json"
+
+    assert list(write_substories(iter([]), str(json_path))) == []
+    assert list(tmp_path.iterdir()) == []
+
+
+def make_substory(**changes):
+    substory = {"title": "A", "lines": [f"line {i}" for i in range(5)], "prompts": [f"prompt {i}" for i in range(5)],
+                "general_prompt": "style"}
+    substory.update(changes)
+    return substory
+
+
+def test_validate_substory_needs_one_prompt_per_line():
+    assert validate_substory(make_substory())
+    assert not validate_substory(make_substory(prompts=[f"prompt {i}" for i in range(6)]))
+    assert not validate_substory(make_substory(lines=["line"] * 4 + [{"text": "line"}]))
+    assert not validate_substory(make_substory(prompts=["prompt"] * 4 + [" "]))
+
+
+@pytest.fixture
+def generator(tmp_path):
+    return Script_Generator(client=Fake_OpenAI(), cache=Disk_Cache(tmp_path / "chat"),
+                            scheduler=Request_Scheduler(max_retries=0))
+
+
+def test_structured_script_is_returned_as_substories(generator):
+    script = generator.generate_script(chapter="text", title="T", num_scripts=3)
+
+    assert len(script["substories"]) == 3
+    assert generator.client.requests["chat"] == 1
+
+
+def test_truncated_structured_script_falls_back_to_text(generator, monkeypatch):
+    monkeypatch.setattr(script_creation, "script_output_budget", lambda num_scripts: 300)
+
+    script = generator.generate_script(chapter="text", title="T", num_scripts=3)
+
+    assert isinstance(script, str)
+    assert generator.client.requests["chat"] == 2
+
+
+class Recording_OpenAI(Fake_OpenAI):
+    """ Keeps the max_tokens and finish_reason of every chat request. """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.completions = []
+
+    def create_chat_completion(self, model, messages, max_tokens=None, response_format=None, **kwargs):
+        response = super().create_chat_completion(model, messages, max_tokens=max_tokens, response_format=response_format, **kwargs)
+        self.completions.append((max_tokens, response.choices[0].finish_reason))
+        return response
+
+
+def test_truncated_structured_script_is_not_truncated_again(tmp_path, monkeypatch):
+    # The fake's three JSON substories take about 650 tokens and its text script about 750.
+    monkeypatch.setattr(script_creation, "script_output_budget", lambda num_scripts: 500)
+    client = Recording_OpenAI()
+    generator = Script_Generator(client=client, cache=Disk_Cache(tmp_path / "chat"), scheduler=Request_Scheduler(max_retries=0))
+
+    script = generator.generate_script(chapter="text", title="T", num_scripts=3)
+
+    assert client.completions == [(500, "length"), (1000, "stop")]
+    assert len(list(parse_substories(script.splitlines()))) == 3
+
+
+def test_api_error_does_not_fall_back_to_text(generator):
+    generator.client.failure_rate = 1.0
+
+    assert generator.generate_script(chapter="text", title="T", num_scripts=3) is None
+    assert generator.client.requests["chat"] == 1
+
+
+def make_parts(count):
+    return [Script_Part(f"chapter_{i}_0", f"Chapter {i}", f"text of chapter {i}", 100, whole_chapter=True) for i in range(count)]
+
+
+def test_packed_request_is_split_back_per_chapter(generator):
+    scripts = generator.generate_scripts_for_parts(make_parts(3))
+
+    assert [len(script["substories"]) for script in scripts] == [3, 3, 3]
+    assert all("chapter" not in substory for script in scripts for substory in script["substories"])
+    assert generator.client.requests["chat"] == 1
+
+
+def test_packed_api_error_is_not_retried_per_chapter(generator):
+    generator.client.failure_rate = 1.0
+
+    assert generator.generate_scripts_for_parts(make_parts(3)) == [None, None, None]
+    assert generator.client.requests["chat"] == 1
+
+
+def test_text_format_requests_each_part(generator):
+    generator.output_format = "text"
+
+    scripts = generator.generate_scripts_for_parts(make_parts(2))
+
+    assert all(isinstance(script, str) for script in scripts)
+    assert generator.client.requests["chat"] == 2
@@ -0,0 +1,124 @@
+import random
+from array import array
+
+import pytest
+import tiktoken
+
+from text_chunker import Text_Chunker, Script_Part, pack_parts, split_units, utilization_report
+
+
+@pytest.fixture(scope="module")
+def encoding():
+    # One token per byte, needs no encoding download.
+    return tiktoken.Encoding("bytes", pat_str=r"\S+|\s+", mergeable_ranks={bytes([i]): i for i in range(256)}, special_tokens={})
+
+
+def chunk_sizes(sizes, boundaries):
+    return [sum(sizes[first:last]) for first, last in zip(boundaries, boundaries[1:])]
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_plan_boundaries_respects_budget(seed):
+    rng = random.Random(seed)
+    sizes = [rng.randint(1, 40) for _ in range(rng.randint(5, 60))]
+    chunker = Text_Chunker(None, max_tokens=100)
+
+    boundaries = chunker.plan_boundaries(sizes, [rng.random() < 0.2 for _ in sizes])
+
+    assert boundaries[0] == 0 and boundaries[-1] == len(sizes)
+    assert boundaries == sorted(set(boundaries))
+    assert all(size <= 100 for size in chunk_sizes(sizes, boundaries))
+    # A small leftover is only left when it cannot join the previous chunk.
+    if len(boundaries) > 2:
+        assert sum(sizes[boundaries[-3]:]) > 100
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_plan_boundaries_uses_fewest_chunks(seed):
+    rng = random.Random(seed)
+    sizes = [rng.randint(1, 60) for _ in range(rng.randint(5, 60))]
+    chunker = Text_Chunker(None, max_tokens=100)
+
+    # Filling every chunk as far as it goes gives the fewest chunks.
+    fewest, size = 1, 0
+    for unit in sizes:
+        if size + unit > 100:
+            fewest, size = fewest + 1, 0
+        size += unit
+    assert len(chunker.plan_boundaries(sizes, [rng.random() < 0.2 for _ in sizes])) - 1 == fewest
+
+
+def test_plan_boundaries_uses_fewest_requests_and_balances_them():
+    chunker = Text_Chunker(None, max_tokens=100)
+    sizes = [10] * 21
+
+    assert chunk_sizes(sizes, chunker.plan_boundaries(sizes, [False] * 21)) == [70, 70, 70]
+
+
+def test_plan_boundaries_prefers_scene_breaks():
+    chunker = Text_Chunker(None, max_tokens=100)
+    sizes = [10] * 15
+    scene_breaks = [False] * 15
+    scene_breaks[7] = True
+
+    assert chunker.plan_boundaries(sizes, scene_breaks) == [0, 7, 15]
+
+
+def test_plan_boundaries_gives_oversized_unit_its_own_chunk():
+    chunker = Text_Chunker(None, max_tokens=100)
+
+    assert chunker.plan_boundaries([30, 150, 30], [False] * 3) == [0, 1, 2, 3]
+
+
+def test_split_units_marks_scene_breaks():
+    text = "First paragraph.\nSecond one.\n\n* * *\nNew scene.\n"
+
+    units = split_units(text)
+
+    assert [text[start:end].strip() for start, end, _ in units] == ["First paragraph.", "Second one.", "New scene."]
+    assert [scene_break for _, _, scene_break in units] == [True, False, True]
+
+
+def test_chunk_cuts_between_paragraphs_within_budget(encoding):
+    rng = random.Random(0)
+    paragraphs = [" ".join(f"word{rng.randint(0, 99)}." for _ in range(rng.randint(5, 30))) for _ in range(80)]
+    text = "\n".join(paragraphs)
+
+    chunks = Text_Chunker(encoding, max_tokens=1000).chunk(text, array("I", encoding.encode(text)))
+
+    chunker = Text_Chunker(encoding, max_tokens=1000)
+    paragraph_sizes = [len(paragraph) + 1 for paragraph in paragraphs]
+    assert len(chunks) == chunker.min_chunks(paragraph_sizes)[0]
+    assert all(token_count <= 1000 for _, token_count in chunks)
+    assert "\n".join(chunk for chunk, _ in chunks) == text
+
+
+def test_chunk_cuts_oversized_paragraph_between_sentences(encoding):
+    text = " ".join(f"Sentence number {i} ends here." for i in range(100))
+
+    chunks = Text_Chunker(encoding, max_tokens=500).chunk(text, array("I", encoding.encode(text)))
+
+    assert all(token_count <= 500 for _, token_count in chunks)
+    assert all(chunk.endswith("ends here.") for chunk, _ in chunks)
+    assert " ".join(chunk for chunk, _ in chunks) == text
+
+
+def test_short_text_is_one_chunk(encoding):
+    text = "A short chapter."
+
+    assert Text_Chunker(encoding, max_tokens=100).chunk(text, array("I", encoding.encode(text))) == [(text, len(text))]
+
+
+def test_pack_parts_batches_adjacent_whole_chapters():
+    parts = [Script_Part(f"c{i}_0", f"c{i}", "", tokens, whole)
+             for i, (tokens, whole) in enumerate([(30, True), (30, True), (50, True), (90, False), (10, True), (10, True)])]
+
+    batches = [[part.script_title for part in batch] for batch in pack_parts(parts, max_tokens=100, max_chapters=4)]
+
+    assert batches == [["c0_0", "c1_0"], ["c2_0"], ["c3_0"], ["c4_0", "c5_0"]]
+
+
+def test_utilization_is_reported_per_packed_request():
+    parts = [Script_Part(f"c{i}_0", f"c{i}", "", tokens, True) for i, tokens in enumerate([30, 30, 50])]
+
+    assert utilization_report(list(pack_parts(parts, max_tokens=100)), max_tokens=100) == [60, 50]
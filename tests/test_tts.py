@@ -0,0 +1,79 @@
+import re
+import time
+import threading
+from types import SimpleNamespace
+
+import openai
+import pytest
+
+from cache import Disk_Cache
+from fake_openai import Fake_OpenAI
+from rate_limiter import Request_Scheduler
+from script_creation import Script_Generator
+from tts import Speech_Generator, pick_voice
+
+UNLIMITED = {"chat": 60000, "images": 60000, "speech": 60000}
+LINES = [f"line {i} of the story." for i in range(6)]
+
+
+class Echo_OpenAI(Fake_OpenAI):
+    """ Returns each line as its audio bytes, and answers later lines first. """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.completed = []
+        self.completed_lock = threading.Lock()
+
+    def create_speech(self, model, voice, input, **kwargs):
+        index = int(re.search(r"line (\d+)", input).group(1))
+        time.sleep(0.02 * (len(LINES) - index))
+        super().create_speech(model, voice, input, **kwargs)
+        with self.completed_lock:
+            self.completed.append(index)
+        return SimpleNamespace(content=f"{voice}: {input}".encode("utf-8"))
+
+
+def make_generator(client, tmp_path):
+    scheduler = Request_Scheduler(rate_limits=UNLIMITED, max_retries=0)
+    script_generator = Script_Generator(client=client, cache=Disk_Cache(tmp_path / "chat"), scheduler=scheduler)
+    return Speech_Generator(client=client, cache=Disk_Cache(tmp_path / "audio", suffix=".mp3"),
+                            scheduler=scheduler, script_generator=script_generator)
+
+
+def test_audio_keeps_line_order_when_requests_finish_out_of_order(tmp_path):
+    client = Echo_OpenAI(latency=(0.0, 0.01))
+    audio_path = tmp_path / "package"
+    make_generator(client, tmp_path).generate_audio(str(audio_path), LINES, max_workers=len(LINES))
+
+    assert client.completed != sorted(client.completed)
+    voice = pick_voice(LINES)
+    for i, line in enumerate(LINES):
+        assert (audio_path / f"audio_{i}.mp3").read_bytes().decode("utf-8") == f"{voice}: {line}"
+
+
+def test_rejected_lines_are_rewritten(tmp_path):
+    # Seed 12 rejects two lines, and neither rewrite.
+    client = Fake_OpenAI(latency=(0.0, 0.002), policy_failure_rate=0.3, seed=12)
+    audio_path = tmp_path / "package"
+    make_generator(client, tmp_path).generate_audio(str(audio_path), LINES, max_workers=1)
+
+    assert client.requests["chat"] == client.failures > 0
+    assert all((audio_path / f"audio_{i}.mp3").exists() for i in range(len(LINES)))
+
+
+def test_transient_errors_are_not_rewritten_and_propagate(tmp_path):
+    # Seed 1 fails two of the six requests.
+    client = Fake_OpenAI(failure_rate=0.3, seed=1)
+    with pytest.raises((openai.RateLimitError, openai.APIConnectionError)):
+        make_generator(client, tmp_path).generate_audio(str(tmp_path / "package"), LINES)
+
+    assert client.failures > 0
+    assert client.requests["chat"] == 0
+
+
+def test_rejected_rewrite_propagates(tmp_path):
+    client = Fake_OpenAI(policy_failure_rate=1.0)
+    with pytest.raises(openai.BadRequestError):
+        make_generator(client, tmp_path).generate_audio(str(tmp_path / "package"), LINES[:1])
+
+    assert client.requests == {"chat": 1, "images": 0, "speech": 2}